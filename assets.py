@@ -0,0 +1,144 @@
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from io import BytesIO
+from PIL import Image, ImageOps
+import instrumentation
+
+# Folder next to the HTML files that holds the images, shared by every document
+# converted into the same output folder
+ASSET_FOLDER = 'assets'
+
+MAX_DIMENSION = 1600  # longest side of a stored image, in pixels
+DISPLAY_SCALE = 2  # pixels stored per CSS pixel shown, so images stay sharp on high-DPI screens
+MIN_DIMENSION = 8  # smaller images are spacers and rules, not worth a file
+WEBP_QUALITY = 80
+
+# path of the .webp and the width/height to show it at
+Asset = namedtuple('Asset', ['path', 'width', 'height'])
+
+
+def _fit(size, box):
+    # size scaled down (never up) to fit inside box, keeping the aspect ratio
+    scale = min(1, box[0] / size[0], box[1] / size[1])
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def transcode(data, dest, size, quality=WEBP_QUALITY):
+    # Runs in a worker process: decode the image bytes, resize them and write a WebP.
+    # The .part file is renamed into place so other processes never see half a file.
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA', 'RGBa') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        part_path = f"{dest}.{os.getpid()}.part"
+        image.save(part_path, 'WEBP', quality=quality, method=4)
+    os.replace(part_path, dest)
+    return dest
+
+
+class AssetStore:
+    """Content addressed store of the images found in documents, saved as WebP.
+
+    An image is named after the SHA-256 of its bytes and its stored size, so a
+    letterhead used by thousands of documents is encoded once and then only
+    looked up, in this run or any later one. Encoding happens in a pool of
+    worker processes while the documents carry on being read; workers=0 encodes
+    in this process instead (for use inside batch workers). Call close() before
+    relying on the files.
+
+    Image tags point at the files relative to html_dir, the folder the HTML
+    pages go to (the parent of asset_dir by default).
+    """
+
+    def __init__(self, asset_dir=ASSET_FOLDER, html_dir=None, workers=None, quality=WEBP_QUALITY):
+        self.asset_dir = asset_dir
+        self.html_dir = html_dir if html_dir is not None else os.path.dirname(os.path.abspath(asset_dir))
+        self.workers = workers
+        self.quality = quality
+        self.stored = 0
+        self.reused = 0
+        self._executor = None
+        self._pending = {}  # path -> Future of images being encoded
+        self._known = set()  # paths known to exist or be on their way
+
+    def add(self, data, display=None):
+        """Store image bytes and return their Asset, or None if Pillow cannot read
+        them or they are too small to matter. display is the (width, height) the
+        document shows the image at in CSS pixels, if it says."""
+        with instrumentation.span('assets.add'):
+            try:
+                # Only the header is read here, decoding happens in the workers
+                with Image.open(BytesIO(data)) as image:
+                    source_size = image.size
+            except Exception:
+                return None
+            if min(source_size) < MIN_DIMENSION:
+                return None
+
+            box = (MAX_DIMENSION, MAX_DIMENSION)
+            if display:
+                box = (min(MAX_DIMENSION, display[0] * DISPLAY_SCALE), min(MAX_DIMENSION, display[1] * DISPLAY_SCALE))
+            size = _fit(source_size, box)
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.asset_dir, digest[:2], f"{digest}-{size[0]}x{size[1]}.webp")
+            width, height = (round(display[0]), round(display[1])) if display else size
+            asset = Asset(path, max(1, width), max(1, height))
+
+            if path in self._known or os.path.exists(path):
+                self._known.add(path)
+                self.reused += 1
+                instrumentation.count('assets_reused')
+                return asset
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.workers == 0:
+                try:
+                    transcode(data, path, size, self.quality)
+                except Exception as e:
+                    print(f"Failed to transcode image {path}: {e}")
+                    return None
+            else:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pending[path] = self._executor.submit(transcode, data, path, size, self.quality)
+            self._known.add(path)
+            self.stored += 1
+            instrumentation.count('assets_stored')
+            return asset
+
+    def img_tag(self, data, display=None, alt=''):
+        # An <img> for the image bytes, or '' when they are not an image we can store
+        asset = self.add(data, display)
+        if asset is None:
+            return ''
+        src = os.path.relpath(asset.path, self.html_dir).replace(os.sep, '/')
+        return (f'<img src="{escape(src)}" alt="{escape(alt)}" width="{asset.width}" '
+                f'height="{asset.height}" loading="lazy">')
+
+    def close(self):
+        # Wait for every image still being encoded, failures are printed and forgotten
+        for path, future in self._pending.items():
+            try:
+                future.result()
+            except Exception as e:
+                self._known.discard(path)
+                print(f"Failed to transcode image {path}: {e}")
+        self._pending = {}
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def report(self):
+        return f"Images: {self.stored} stored, {self.reused} reused from {self.asset_dir}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+# Columns written to the manifest, in order
+MANIFEST_FIELDS = ['input', 'output', 'status', 'duration', 'error']
+
+
+def output_path_for(file_path, output_folder, extension='.html'):
+    # Output names only depend on the input name so reruns overwrite the same files
+    return os.path.join(output_folder, f"{os.path.splitext(os.path.basename(file_path))[0]}{extension}")
+
+
+def _init_worker():
+    # Forked workers start with a copy of the parent's metrics (e.g. its cache.key
+    # spans), which would be sent back and counted twice
+    instrumentation.reset()
+
+
+def _run_job(job):
+    # Runs in the worker process: convert one file and report how it went.
+    # Errors are caught here so one bad file never takes the whole batch down.
+    convert, file_path, output_folder, metrics = job
+    if metrics:
+        instrumentation.enable()
+    start = time.perf_counter()
+    record = {'input': file_path, 'output': '', 'status': 'ok', 'duration': 0.0, 'error': ''}
+    try:
+        record['output'] = convert(file_path, output_folder)
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+    record['duration'] = round(time.perf_counter() - start, 4)
+    if metrics:
+        # Sent back with the record, the parent adds them to its own
+        record['metrics'] = instrumentation.collect()
+    return record
+
+
+def write_manifest(records, manifest_path):
+    # The manifest format is picked from the file extension (.csv, anything else is JSON)
+    if manifest_path.endswith('.csv'):
+        with open(manifest_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+
+def run_batch(convert, input_folder, output_folder, extension, workers=None, manifest_path=None,
+              cache=None, identity=None):
+    """Convert every file in input_folder ending with extension across a process pool.
+
+    convert must be a module level function taking (file_path, output_folder) and
+    returning the output path. It should raise on failure.
+    When a ConversionCache is given, identity is the (converter, version, template)
+    tuple used for its keys; hits are copied in this process and never reach the pool.
+    Returns the list of manifest records, sorted by input name.
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # Sorted so the manifest order is the same on every run
+    filenames = sorted(f for f in os.listdir(input_folder) if f.endswith(extension))
+
+    records = {}
+    keys = {}
+    jobs = []
+    for filename in filenames:
+        file_path = os.path.join(input_folder, filename)
+        if cache is not None:
+            start = time.perf_counter()
+            keys[file_path] = cache.key(file_path, *identity)
+            output_path = output_path_for(file_path, output_folder)
+            if cache.fetch(keys[file_path], output_path):
+                records[file_path] = {'input': file_path, 'output': output_path, 'status': 'cached',
+                                      'duration': round(time.perf_counter() - start, 4), 'error': ''}
+                continue
+        jobs.append((convert, file_path, output_folder, instrumentation.enabled()))
+
+    if workers == 1:
+        results = [_run_job(job) for job in jobs]
+    else:
+        # Small chunks keep the workers evenly loaded when file sizes vary a lot
+        chunksize = max(1, min(16, len(jobs) // ((workers or os.cpu_count() or 1) * 4)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = list(executor.map(_run_job, jobs, chunksize=chunksize))
+
+    for record in results:
+        if 'metrics' in record:
+            instrumentation.merge(record.pop('metrics'))
+        records[record['input']] = record
+        if cache is not None and record['status'] == 'ok':
+            cache.put(keys[record['input']], record['output'])
+    records = [records[os.path.join(input_folder, f)] for f in filenames]
+
+    for record in records:
+        if record['status'] == 'failed':
+            print(f"Failed to convert {record['input']}: {record['error']}")
+
+    if manifest_path:
+        write_manifest(records, manifest_path)
+        print(f"Manifest written to {manifest_path}")
+    if cache is not None:
+        print(cache.report())
+
+    return records
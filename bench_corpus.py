@@ -0,0 +1,130 @@
+import csv
+import random
+
+# Synthetic inputs for benchmark.py. Everything is seeded so the same size
+# always produces the same files.
+
+WORDS = ('the', 'party', 'shall', 'agreement', 'company', 'charge', 'security', 'debenture',
+         'lender', 'borrower', 'property', 'notice', 'of', 'in', 'to', 'any', 'such', 'and')
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def make_docx(path, paragraphs=100, list_items=20, tables=((10, 4),), seed=0):
+    """A .docx with a CONTENTS page, headings, body paragraphs, bullet and numbered
+    lists and tables of rows x cols with a merged cell in the first row."""
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    doc.add_heading('Debenture', 1)
+    for i in range(paragraphs):
+        if i % 25 == 0:
+            doc.add_heading(f'Clause {i // 25 + 1}', 2)
+        paragraph = doc.add_paragraph(_sentence(rng) + ' ')
+        paragraph.add_run(_sentence(rng, 4)).bold = True
+        paragraph.add_run(' ' + _sentence(rng, 6)).italic = True
+
+    for i in range(list_items):
+        style = 'List Bullet' if i % 2 == 0 else 'List Number'
+        doc.add_paragraph(_sentence(rng, 8), style=style)
+
+    for rows, cols in tables:
+        table = doc.add_table(rows=rows, cols=cols)
+        for r in range(rows):
+            for c in range(cols):
+                table.cell(r, c).text = f'{r}.{c} {rng.choice(WORDS)}'
+        if cols > 1:
+            table.cell(0, 0).merge(table.cell(0, 1))
+        doc.add_paragraph(_sentence(rng))
+
+    # main2 treats everything after CONTENTS as the contents page, so it goes last
+    doc.add_paragraph('CONTENTS')
+    for i in range(1, 11):
+        doc.add_paragraph(f'{i}. Clause {i} ........ {i + 1}')
+
+    doc.save(path)
+    return path
+
+
+def make_pdf(path, pages=20, lines_per_page=45, contents_entries=20, seed=0):
+    """A text PDF with a CONTENTS section followed by numbered clauses, (n) items and body text."""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    lines = ['CONTENTS'] + [f'{i}. Clause {i} ........ {i + 2}' for i in range(1, contents_entries + 1)]
+    while len(lines) < pages * lines_per_page:
+        roll = rng.random()
+        if roll < 0.08:
+            lines.append(f'{rng.randint(1, 40)}. {_sentence(rng, 4)}')
+        elif roll < 0.16:
+            lines.append(f'({rng.randint(1, 9)}) {_sentence(rng, 8)}')
+        elif roll < 0.3:
+            lines.append('')
+        else:
+            lines.append(_sentence(rng, 10))
+
+    doc = fitz.open()
+    for start in range(0, pages * lines_per_page, lines_per_page):
+        page = doc.new_page()
+        page.insert_text((50, 50), '\n'.join(lines[start:start + lines_per_page]), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_csv(path, rows=10000, cols=8, seed=0):
+    """A price list style CSV with text, integer, float and date columns."""
+    rng = random.Random(seed)
+    extra = max(0, cols - 5)
+    header = ['sku', 'description', 'quantity', 'price', 'updated'] + [f'extra_{i}' for i in range(extra)]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header[:cols])
+        for i in range(rows):
+            row = [f'SKU-{i:07d}', _sentence(rng, 4) + ' <&>', rng.randint(0, 500), round(rng.uniform(1, 999), 2),
+                   f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}']
+            row += [rng.choice(WORDS) for _ in range(extra)]
+            writer.writerow(row[:cols])
+    return path
+
+
+def make_image(path, lines=20, width=1240, seed=0):
+    """A white page with black text lines, for the OCR path."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    line_height = 40
+    image = Image.new('L', (width, line_height * (lines + 2)), 255)
+    draw = ImageDraw.Draw(image)
+    for i in range(lines):
+        text = 'TERMS AND CONDITIONS' if i % 8 == 0 else _sentence(rng, 8)
+        draw.text((40, line_height * (i + 1)), text, fill=0)
+    image.save(path)
+    return path
+
+
+def make_markdown(path, paragraphs=1000, seed=0):
+    """Pandoc style markdown full of _Toc anchors and (\\l) escapes for the cleaners."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(paragraphs):
+            if i % 20 == 0:
+                f.write(f'[]{{#_Toc{100000 + i} .anchor}}{i // 20 + 1}. Heading [link](#_Toc{100000 + i}) (\\l)\n\n')
+            f.write(_sentence(rng, 30) + '\n\n')
+    return path
+
+
+def make_html(path, paragraphs=1000, seed=0):
+    """Pandoc style HTML with ids, empty cells, {...} leftovers and comments for clean_html."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html><head><title>bench</title><style>p { margin: 0; }</style></head><body>\n')
+        for i in range(paragraphs):
+            f.write(f'<p id="p{i}">{_sentence(rng, 20)} {{.anchor}}</p><!-- -->\n')
+            if i % 10 == 0:
+                f.write(f'<table id="t{i}"><tr><td></td><td>{i}</td></tr></table>\n')
+        f.write('</body></html>\n')
+    return path
@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bench_corpus
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# Input sizes per preset
+SIZES = {
+    'small': {'paragraphs': 200, 'list_items': 40, 'table': (20, 5), 'pages': 20, 'rows': 10000, 'image_lines': 10},
+    'medium': {'paragraphs': 2000, 'list_items': 400, 'table': (200, 8), 'pages': 200, 'rows': 100000, 'image_lines': 40},
+    'large': {'paragraphs': 10000, 'list_items': 2000, 'table': (500, 12), 'pages': 1000, 'rows': 1000000, 'image_lines': 80},
+}
+
+
+class Skip(Exception):
+    pass
+
+
+def _corpus_file(corpus_dir, name, make, **kwargs):
+    # Inputs are generated once per corpus directory and reused by later runs
+    path = os.path.join(corpus_dir, name)
+    if not os.path.exists(path):
+        make(path, **kwargs)
+    return path
+
+
+# Every case returns (function to time, units processed per call, unit name)
+
+def case_read_word_file(corpus_dir, size):
+    import main2
+    path = _corpus_file(corpus_dir, f"doc_{size['paragraphs']}.docx", bench_corpus.make_docx,
+                        paragraphs=size['paragraphs'], list_items=size['list_items'], tables=[size['table']])
+    return (lambda: main2.read_word_file(path)), size['paragraphs'] + size['list_items'], 'paragraphs'
+
+
+def case_docx_stream(corpus_dir, size):
+    import docx_stream
+    path = _corpus_file(corpus_dir, f"doc_{size['paragraphs']}.docx", bench_corpus.make_docx,
+                        paragraphs=size['paragraphs'], list_items=size['list_items'], tables=[size['table']])
+    return (lambda: docx_stream.read_word_file(path)), size['paragraphs'] + size['list_items'], 'paragraphs'
+
+
+def case_format_table(corpus_dir, size):
+    import main2
+    from docx import Document
+    rows, cols = size['table']
+    path = _corpus_file(corpus_dir, f"table_{rows}x{cols}.docx", bench_corpus.make_docx,
+                        paragraphs=0, list_items=0, tables=[size['table']])
+    table = Document(path).tables[0]
+    return (lambda: main2.format_table(table)), rows, 'rows'
+
+
+def case_read_pdf_file(corpus_dir, size):
+    import main5
+    path = _corpus_file(corpus_dir, f"doc_{size['pages']}.pdf", bench_corpus.make_pdf, pages=size['pages'])
+    return (lambda: main5.read_pdf_file(path)), size['pages'], 'pages'
+
+
+def case_convert_csv_to_html(corpus_dir, size):
+    import main4
+    path = _corpus_file(corpus_dir, f"prices_{size['rows']}.csv", bench_corpus.make_csv, rows=size['rows'])
+    return (lambda: main4.convert_csv_to_html(path)), size['rows'], 'rows'
+
+
+def case_pandoc_pipeline(corpus_dir, size):
+    if not shutil.which('pandoc'):
+        raise Skip('pandoc is not installed')
+    import pandoc_pipeline
+    path = _corpus_file(corpus_dir, f"doc_{size['paragraphs']}.docx", bench_corpus.make_docx,
+                        paragraphs=size['paragraphs'], list_items=size['list_items'], tables=[size['table']])
+    return (lambda: pandoc_pipeline.convert_docx_to_html(path)), 1, 'documents'
+
+
+def case_clean_markdown(corpus_dir, size):
+    import clean_md
+    path = _corpus_file(corpus_dir, f"export_{size['paragraphs']}.md", bench_corpus.make_markdown,
+                        paragraphs=size['paragraphs'] * 10)
+    output = os.path.join(corpus_dir, 'cleaned.md')
+    megabytes = os.path.getsize(path) / 1024 / 1024
+    return (lambda: clean_md.clean_markdown(path, output)), megabytes, 'MB'
+
+
+def case_clean_html(corpus_dir, size):
+    import clean_html
+    path = _corpus_file(corpus_dir, f"export_{size['paragraphs']}.html", bench_corpus.make_html,
+                        paragraphs=size['paragraphs'] * 10)
+    output = os.path.join(corpus_dir, 'cleaned.html')
+    megabytes = os.path.getsize(path) / 1024 / 1024
+    return (lambda: clean_html.clean_html(path, output)), megabytes, 'MB'
+
+
+def case_ocr(corpus_dir, size):
+    if not shutil.which('tesseract'):
+        raise Skip('tesseract is not installed')
+    import pytesseract
+    from PIL import Image
+    import main3
+    path = _corpus_file(corpus_dir, f"scan_{size['image_lines']}.png", bench_corpus.make_image,
+                        lines=size['image_lines'])
+    return (lambda: main3.format_to_html(pytesseract.image_to_string(Image.open(path)))), 1, 'pages'
+
+
+def case_render_small_pages(corpus_dir, size):
+    # Page template overhead: many small documents of a few fragments each
+    import templates
+    from html_writer import stream_template
+    fragments = [f'<p>Clause {i}</p>' for i in range(20)]
+    output = os.path.join(corpus_dir, 'page.html')
+    pages = size['paragraphs'] // 4
+
+    def render():
+        for _ in range(pages):
+            stream_template(templates.get_template(), output, fragments, filename='page')
+    return render, pages, 'pages'
+
+
+def _cold_start(path, output_dir):
+    # A fresh interpreter converting one small file through the unified CLI
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'document_to_html.py')
+    return lambda: subprocess.run([sys.executable, script, path, '-o', output_dir], check=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def case_cold_start_csv(corpus_dir, size):
+    path = _corpus_file(corpus_dir, 'prices_100.csv', bench_corpus.make_csv, rows=100)
+    return _cold_start(path, os.path.join(corpus_dir, 'cli')), 1, 'starts'
+
+
+def case_cold_start_clean_html(corpus_dir, size):
+    path = _corpus_file(corpus_dir, 'export_100.html', bench_corpus.make_html, paragraphs=100)
+    return _cold_start(path, os.path.join(corpus_dir, 'cli')), 1, 'starts'
+
+
+CASES = {
+    'main2.read_word_file': case_read_word_file,
+    'docx_stream.read_word_file': case_docx_stream,
+    'main2.format_table': case_format_table,
+    'main5.read_pdf_file': case_read_pdf_file,
+    'main4.convert_csv_to_html': case_convert_csv_to_html,
+    'pandoc_pipeline.convert_docx_to_html': case_pandoc_pipeline,
+    'clean_md.clean_markdown': case_clean_markdown,
+    'clean_html.clean_html': case_clean_html,
+    'main3.ocr': case_ocr,
+    'templates.render_small_pages': case_render_small_pages,
+    'document_to_html.cold_start.csv': case_cold_start_csv,
+    'document_to_html.cold_start.html': case_cold_start_clean_html,
+}
+
+
+def run_case(function, repeat):
+    # The converters print progress, which is not what is being measured
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        function()  # warm up imports and caches
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+        # Separate run for memory, tracemalloc slows everything down. It only sees
+        # memory allocated through Python, not inside lxml, fitz or pandoc.
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return times, peak
+
+
+def run(size_name='small', only=None, repeat=3, corpus_dir=None):
+    size = SIZES[size_name]
+    keep_corpus = corpus_dir is not None
+    corpus_dir = corpus_dir or tempfile.mkdtemp(prefix='bench-corpus-')
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    results = {}
+    try:
+        for name, case in CASES.items():
+            if only and not any(part in name for part in only):
+                continue
+            try:
+                function, units, unit = case(corpus_dir, size)
+            except (Skip, ImportError) as e:
+                print(f"{name:40} skipped: {e}")
+                continue
+
+            times, peak = run_case(function, repeat)
+            seconds = statistics.median(times)
+            results[name] = {
+                'seconds': round(seconds, 6),
+                'min_seconds': round(min(times), 6),
+                'throughput': round(units / seconds, 3) if seconds else None,
+                'unit': f'{unit}/s',
+                'peak_mb': round(peak / 1024 / 1024, 3),
+            }
+            print(f"{name:40} {seconds * 1000:10.1f} ms  {results[name]['throughput']:12,.1f} {unit}/s"
+                  f"  {results[name]['peak_mb']:8.1f} MB peak")
+    finally:
+        if not keep_corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'size': size_name,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, time_threshold=0.2, memory_threshold=0.2):
+    """Return a list of regressions: cases more than time_threshold slower or
+    memory_threshold bigger (as fractions) than the baseline."""
+    regressions = []
+    if baseline['meta'].get('size') != current['meta'].get('size'):
+        print(f"Warning: baseline size {baseline['meta'].get('size')} != current size {current['meta'].get('size')}")
+
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        if result['seconds'] > base['seconds'] * (1 + time_threshold):
+            regressions.append(f"{name}: {result['seconds']:.4f}s vs {base['seconds']:.4f}s baseline "
+                               f"(+{(result['seconds'] / base['seconds'] - 1) * 100:.0f}%)")
+        if base['peak_mb'] and result['peak_mb'] > base['peak_mb'] * (1 + memory_threshold):
+            regressions.append(f"{name}: {result['peak_mb']:.1f} MB vs {base['peak_mb']:.1f} MB baseline "
+                               f"(+{(result['peak_mb'] / base['peak_mb'] - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the converters on generated documents')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--only', action='append', help='only run cases whose name contains this, can be repeated')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--corpus-dir', help='keep the generated inputs here and reuse them next time')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--time-threshold', type=float, default=0.2, help='allowed slowdown, 0.2 = 20%%')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='allowed memory growth, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    current = run(args.size, args.only, args.repeat, args.corpus_dir)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.time_threshold, args.memory_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
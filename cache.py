@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import instrumentation
+
+DEFAULT_CACHE_DIR = '.conversion-cache'
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+
+class ConversionCache:
+    """On disk cache of converted files, keyed by the input bytes and how they were converted.
+
+    Entries are plain files under cache_dir. An entry's mtime is bumped every
+    time it is used so the least recently used ones are evicted first once the
+    cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0  # input bytes that did not need converting
+        self._input_sizes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def key(self, file_path, converter, version, template=''):
+        # Hash of the input bytes plus everything that changes the output. The file
+        # name is part of it since pages show it in their <title>, so two copies of
+        # the same file under different names don't get each other's HTML
+        digest = hashlib.sha256()
+        with instrumentation.span('cache.key'), open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        for part in (converter, version, template, os.path.basename(file_path)):
+            digest.update(b'\0')
+            digest.update(str(part).encode('utf-8'))
+        key = digest.hexdigest()
+        self._input_sizes[key] = os.path.getsize(file_path)
+        return key
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _entries(self):
+        # Only the shard folders named by _path(); other things kept in cache_dir
+        # (the jinja bytecode, the fragment index) are not entries
+        for shard in os.scandir(self.cache_dir):
+            if len(shard.name) == 2 and shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        yield entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        # Returns the path of the cached file or None, and keeps the hit/miss counts
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        self.bytes_saved += self._input_sizes.get(key, 0)
+        return path
+
+    def fetch(self, key, dest_path):
+        # Copy a cached file to dest_path, returns False on a miss
+        path = self.get(key)
+        if path is None:
+            return False
+        with instrumentation.span('cache.fetch'):
+            shutil.copyfile(path, dest_path)
+        return True
+
+    def put(self, key, src_path):
+        # Store a finished output file under key
+        if not os.path.exists(src_path):
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        # Copy to a temp file first so other processes never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+        self.total_bytes += os.path.getsize(path) - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_saved': self.bytes_saved,
+            'cache_bytes': self.total_bytes,
+        }
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        return (f"Cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.bytes_saved / 1024 / 1024:.1f} MB of input skipped, "
+                f"{self.total_bytes / 1024 / 1024:.1f} MB in {self.cache_dir}")
@@ -1,31 +1,154 @@
-import re
+import argparse
+import html
 import os
+import re
+from lxml import etree
+
+# Void elements have no end tag and are never removed for being empty
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+KEEP_TAGS = VOID_TAGS | {'html', 'head', 'body', 'script', 'style', 'textarea'}
+
+# Text inside these is written as is, so CSS and JS survive the {...} strip
+RAW_TEXT_TAGS = {'script', 'style'}
+
+BRACES_PATTERN = re.compile(r'{[^{}]*}')
+
+
+class _Sanitizer:
+    """lxml parser target that cleans the document as the parser walks through it.
+
+    Nothing is kept in memory apart from the text run being read and the
+    chain of open elements that are empty so far (they are only written once
+    something non-empty turns up inside them, otherwise they are dropped).
+    """
+
+    def __init__(self, out, drop_attributes, remove_empty, strip_braces, remove_comments):
+        self.out = out
+        self.drop_attributes = drop_attributes
+        self.remove_empty = remove_empty
+        self.strip_braces = strip_braces
+        self.remove_comments = remove_comments
+        # [start tag, whitespace seen inside] for the innermost open elements that are
+        # still empty, always a run at the top of the open element stack
+        self.deferred = []
+        self.text = []       # text run since the last tag
+        self.raw = 0         # depth inside <script>/<style>
+
+    def _flush_deferred(self):
+        for start_tag, whitespace in self.deferred:
+            self.out.write(start_tag)
+            self.out.write(whitespace)
+        self.deferred = []
+
+    def _flush_text(self):
+        if not self.text:
+            return
+        text = ''.join(self.text)
+        self.text = []
+        if self.raw:
+            self._flush_deferred()
+            self.out.write(text)
+            return
+
+        if self.strip_braces and '{' in text:
+            text = BRACES_PATTERN.sub('', text)
+        if not text:
+            return
+        if self.deferred and not text.strip():
+            # Whitespace alone does not make an element non-empty
+            self.deferred[-1][1] += text
+            return
+        self._flush_deferred()
+        self.out.write(html.escape(text, quote=False))
+
+    def doctype(self, name, pubid, system):
+        doctype = f'<!DOCTYPE {name}'
+        if pubid:
+            doctype += f' PUBLIC "{pubid}"'
+            if system:
+                doctype += f' "{system}"'
+        elif system:
+            doctype += f' SYSTEM "{system}"'
+        self.out.write(doctype + '>\n')
+
+    def start(self, tag, attrib):
+        self._flush_text()
+        attributes = ''.join(f' {name}="{html.escape(value, quote=True)}"'
+                             for name, value in attrib.items() if name not in self.drop_attributes)
+        start_tag = f'<{tag}{attributes}>'
+        if tag in RAW_TEXT_TAGS:
+            self.raw += 1
+
+        if self.remove_empty and not attributes and tag not in KEEP_TAGS:
+            self.deferred.append([start_tag, ''])
+        else:
+            self._flush_deferred()
+            self.out.write(start_tag)
+
+    def end(self, tag):
+        self._flush_text()
+        if tag in RAW_TEXT_TAGS:
+            self.raw -= 1
+
+        if self.deferred:
+            # Nothing but whitespace (or other empty elements) inside: drop it
+            self.deferred.pop()
+        elif tag not in VOID_TAGS:
+            self.out.write(f'</{tag}>')
+
+    def data(self, text):
+        self.text.append(text)
+
+    def comment(self, text):
+        if self.remove_comments:
+            return
+        self._flush_text()
+        self._flush_deferred()
+        self.out.write(f'<!--{text}-->')
+
+    def close(self):
+        self._flush_text()
+        self._flush_deferred()
 
-def clean_html(input_file, output_file):
-    # Read the input HTML file
-    with open(input_file, 'r', encoding='utf-8') as file:
-        content = file.read()
 
-    # Remove id attributes from all elements
-    cleaned_content = re.sub(r'\s+id\s*=\s*"[^"]*"', '', content)
+def clean_html(input_file, output_file, remove_input=False, drop_attributes=('id',),
+               remove_empty=True, strip_braces=True, remove_comments=True, encoding='utf-8'):
+    """Clean an HTML file in one streaming pass with bounded memory.
 
-    # Remove empty elements like <td></td>
-    cleaned_content = re.sub(r'<([a-zA-Z0-9]+)\s*>\s*</\1>', '', cleaned_content)
+    drop_attributes: attribute names removed from every element
+    remove_empty: drop elements with no attributes and nothing but whitespace inside (e.g. <td></td>)
+    strip_braces: remove {...} left over from pandoc attribute blocks (not inside <style>/<script>)
+    remove_comments: drop all HTML comments
+    """
+    with open(output_file, 'w', encoding='utf-8') as out:
+        target = _Sanitizer(out, set(drop_attributes), remove_empty, strip_braces, remove_comments)
+        parser = etree.HTMLParser(target=target, encoding=encoding, huge_tree=True,
+                                  remove_comments=remove_comments)
+        # Parsing from the file lets libxml2 read it in blocks and drop what it has
+        # already parsed, the target writes the cleaned output as it goes
+        etree.parse(input_file, parser)
+        out.write('\n')
 
-    # Remove content within curly braces and any other content within {}
-    cleaned_content = re.sub(r'{[^{}]*}', '', cleaned_content)
-    html_comment_pattern = r'<!-- -->'
-    cleaned_content = re.sub(html_comment_pattern, '', cleaned_content)
+    if remove_input:
+        os.remove(input_file)
 
-    # Save the cleaned content to a new file
-    with open(output_file, 'w', encoding='utf-8') as file:
-        file.write(cleaned_content)
-    
-    os.remove(input_file)
 
-# Define the input and output file names
-input_file = 'output.html'
-output_file = 'output_cleaned.html'
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove ids, empty elements, {...} and comments from an HTML file')
+    parser.add_argument('input_file', nargs='?', default='output.html')
+    parser.add_argument('output_file', nargs='?', default='output_cleaned.html')
+    parser.add_argument('--drop-attribute', action='append', dest='drop_attributes',
+                        help='attribute to remove, can be repeated (default: id)')
+    parser.add_argument('--keep-empty', action='store_true', help='do not remove empty elements')
+    parser.add_argument('--keep-braces', action='store_true', help='do not remove {...} from text')
+    parser.add_argument('--keep-comments', action='store_true', help='do not remove HTML comments')
+    parser.add_argument('--remove-input', action='store_true', help='delete the input file afterwards')
+    args = parser.parse_args()
 
-# Call the function to clean the HTML file
-clean_html(input_file, output_file)
+    # Call the function to clean the HTML file
+    clean_html(args.input_file, args.output_file,
+               remove_input=args.remove_input,
+               drop_attributes=args.drop_attributes or ('id',),
+               remove_empty=not args.keep_empty,
+               strip_braces=not args.keep_braces,
+               remove_comments=not args.keep_comments)
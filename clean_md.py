@@ -1,32 +1,118 @@
-import re
+import argparse
+import glob
 import os
+import re
+
+# The _Toc link endings (#_Toc123) and anchors []{#_Toc123 .anchor} share one
+# pattern. It starts with a literal so re can jump between candidates with a fast
+# substring search; the ( or []{ in front is checked by hand in _remove_toc.
+TOC_PATTERN = re.compile(r'#_Toc\d+(?:\)| \.anchor\})')
+# (\l) escapes are a plain string, removed with str.replace
+NEWLINE_ESCAPE = '(\\l)'
+
+CHUNK_SIZE = 1024 * 1024
+# Longest partial match held back at the end of a chunk
+MAX_HOLD = 256
+
+
+def _split_point(buffer):
+    # Every match starts with ( or [ and its only ) or } is the last character, so a
+    # match cut off by the end of the chunk starts at the last ( or [ with no ) or }
+    # after it. Everything before that point can be cleaned and written safely.
+    start = max(buffer.rfind('('), buffer.rfind('['))
+    if start == -1 or len(buffer) - start > MAX_HOLD:
+        return len(buffer)
+    tail = buffer[start:]
+    if ')' in tail or '}' in tail:
+        return len(buffer)
+    return start
+
+
+def _remove_toc(text):
+    pieces = []
+    position = 0
+    for match in TOC_PATTERN.finditer(text):
+        start = match.start()
+        if match.group().endswith(')'):
+            opener = '('
+        else:
+            opener = '[]{'
+        if text[max(start - len(opener), 0):start] != opener:
+            continue
+        pieces.append(text[position:start - len(opener)])
+        position = match.end()
+    if not pieces:
+        return text
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+
+def clean_text(text):
+    # Same result as the three re.sub passes this module used to make
+    return _remove_toc(text).replace(NEWLINE_ESCAPE, '')
+
+
+def clean_markdown_stream(source, out, chunk_size=CHUNK_SIZE):
+    # Clean from one open file to another, chunk by chunk with flat memory
+    carry = ''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        buffer = carry + chunk
+        split = _split_point(buffer)
+        out.write(clean_text(buffer[:split]))
+        carry = buffer[split:]
+    out.write(clean_text(carry))
+
+
+def clean_markdown(input_file, output_file, remove_input=False, chunk_size=CHUNK_SIZE):
+    # newline='' keeps the original line endings untouched
+    with open(input_file, 'r', encoding='utf-8', newline='') as source, \
+            open(output_file, 'w', encoding='utf-8', newline='') as out:
+        clean_markdown_stream(source, out, chunk_size)
+
+    if remove_input:
+        os.remove(input_file)
 
-def clean_markdown(input_file, output_file):
-    # Read the input markdown file
-    with open(input_file, 'r', encoding='utf-8') as file:
-        content = file.read()
 
-    # Define the patterns to remove
-    end_pattern = r'\(#_Toc\d+\)'
-    start_pattern = r'\[\]{#_Toc\d+ \.anchor}'
-    newline_escape_pattern = r'\(\\l\)'
-    
+def expand_inputs(inputs, suffix='_cleaned'):
+    # Files, directories (every .md inside) and glob patterns, skipping outputs of earlier runs
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.md')))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(m for m in matches if not os.path.splitext(m)[0].endswith(suffix))
+    return paths
 
-    # Remove the patterns
-    cleaned_content = re.sub(end_pattern, '', content)
-    cleaned_content = re.sub(start_pattern, '', cleaned_content)
-    cleaned_content = re.sub(newline_escape_pattern, '', cleaned_content)
 
-    # Save the cleaned content to a new file
-    with open(output_file, 'w', encoding='utf-8') as file:
-        file.write(cleaned_content)
+def clean_paths(inputs, suffix='_cleaned', remove_input=False):
+    # Clean every matching file to <name><suffix>.md next to it, returns the outputs
+    outputs = []
+    for input_file in expand_inputs(inputs, suffix):
+        root, ext = os.path.splitext(input_file)
+        output_file = f"{root}{suffix}{ext}"
+        clean_markdown(input_file, output_file, remove_input=remove_input)
+        outputs.append(output_file)
+    return outputs
 
-    # Delete the original file
-    os.remove(input_file)
 
-# Define the input and output file names
-input_file = 'output.md'
-output_file = 'output_cleaned.md'
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove _Toc anchors and (\\l) escapes from pandoc markdown')
+    parser.add_argument('inputs', nargs='*', default=['output.md'],
+                        help='markdown files, directories or glob patterns (default: output.md)')
+    parser.add_argument('-o', '--output', help='output file, only when cleaning a single file')
+    parser.add_argument('--suffix', default='_cleaned', help='added to the name of each output file')
+    parser.add_argument('--remove-input', action='store_true', help='delete each input file afterwards')
+    args = parser.parse_args()
 
-# Call the function to clean the markdown file
-clean_markdown(input_file, output_file)
+    if args.output:
+        inputs = expand_inputs(args.inputs, args.suffix)
+        if len(inputs) != 1:
+            parser.error('--output needs exactly one input file')
+        clean_markdown(inputs[0], args.output, remove_input=args.remove_input)
+    else:
+        for output_file in clean_paths(args.inputs, args.suffix, remove_input=args.remove_input):
+            print(f"Cleaned markdown saved to {output_file}")
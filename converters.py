@@ -0,0 +1,129 @@
+import importlib
+import os
+import subprocess
+
+# Every converter by format, all called as convert(input_path, output_path, **options)
+# and returning the path written. The backends are imported inside the functions so
+# that only the one a file needs gets loaded.
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.webp', '.gif', '.bmp')
+
+FORMATS_BY_EXTENSION = {
+    '.docx': 'docx',
+    '.pdf': 'pdf',
+    '.csv': 'table', '.xlsx': 'table', '.xls': 'table', '.parquet': 'table',
+    '.md': 'md',
+    '.html': 'html', '.htm': 'html',
+    **{extension: 'image' for extension in IMAGE_EXTENSIONS},
+}
+
+# The modules each format needs, imported up front by warm()
+BACKENDS = {
+    'docx': ['docx_stream'],
+    'pdf': ['main5'],
+    'table': ['main4'],
+    'image': ['main3'],
+    'md': ['clean_md', 'clean_html'],
+    'html': ['clean_html'],
+}
+
+
+def format_for(path):
+    # The format of a file from its extension, ValueError for anything else
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS_BY_EXTENSION:
+        raise ValueError(f"Unsupported file type {extension or path}, expected one of "
+                         f"{', '.join(sorted(FORMATS_BY_EXTENSION))}")
+    return FORMATS_BY_EXTENSION[extension]
+
+
+def output_path_for(input_path, output_folder, format=None):
+    # <name>.html in output_folder, or <name>_cleaned.html for HTML clean up so the
+    # input is never overwritten
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    if (format or format_for(input_path)) == 'html':
+        name += '_cleaned'
+    return os.path.join(output_folder, f"{name}.html")
+
+
+def convert_docx(input_path, output_path, images=True, image_workers=0, theme='plain', reuse_fragments=False):
+    import docx_stream
+
+    if not docx_stream.convert_file(input_path, output_path, images=images, image_workers=image_workers,
+                                    theme=theme, reuse_fragments=reuse_fragments):
+        raise ValueError(f"Failed to read the file: {os.path.basename(input_path)}")
+    return output_path
+
+
+def convert_pdf(input_path, output_path, workers=1, ocr=True, images=True, theme='legal-print', section_pages=None,
+                split_clauses=False, layout=False):
+    import main5
+
+    return main5.convert_file(input_path, output_path, workers=workers, ocr=ocr, images=images, theme=theme,
+                              section_pages=section_pages, split_clauses=split_clauses, layout=layout)
+
+
+def convert_table(input_path, output_path, chunk_rows=None, dtype=None, usecols=None):
+    import main4
+
+    return main4.write_table_html(input_path, output_path, chunk_rows or main4.CHUNK_ROWS, dtype, usecols)
+
+
+def convert_image(input_path, output_path, **options):
+    import main3
+
+    return main3.convert_file(input_path, output_path, **options)
+
+
+def convert_markdown(input_path, output_path):
+    # The README's markdown steps in one go: clean_md, pandoc to HTML, clean_html
+    import clean_html
+    import clean_md
+
+    with open(input_path, encoding='utf-8') as f:
+        text = clean_md.clean_text(f.read())
+    title = os.path.splitext(os.path.basename(input_path))[0]
+    part_path = output_path + '.part'
+    try:
+        subprocess.run(['pandoc', '-f', 'markdown', '-t', 'html', '--standalone', '--metadata', f'pagetitle={title}',
+                        '-o', part_path], input=text.encode('utf-8'), capture_output=True, check=True)
+        clean_html.clean_html(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return output_path
+
+
+def convert_html(input_path, output_path, **options):
+    import clean_html
+
+    clean_html.clean_html(input_path, output_path, **options)
+    return output_path
+
+
+CONVERTERS = {
+    'docx': convert_docx,
+    'pdf': convert_pdf,
+    'table': convert_table,
+    'image': convert_image,
+    'md': convert_markdown,
+    'html': convert_html,
+}
+
+
+def convert(input_path, output_path=None, format=None, **options):
+    """Convert one file with the converter for its format (from the extension
+    unless given). output_path defaults to output_path_for() next to the input."""
+    format = format or format_for(input_path)
+    if format not in CONVERTERS:
+        raise ValueError(f"Unknown format {format}, expected one of {', '.join(CONVERTERS)}")
+    if output_path is None:
+        output_path = output_path_for(input_path, os.path.dirname(input_path) or '.', format)
+    return CONVERTERS[format](input_path, output_path, **options)
+
+
+def warm(formats=None):
+    # Import the backends ahead of the first job, e.g. in a pool initializer
+    for format in formats or BACKENDS:
+        for module in BACKENDS[format]:
+            importlib.import_module(module)
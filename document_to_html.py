@@ -0,0 +1,90 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+import converters
+from templates import THEMES
+
+# One command for every file type. Only the backend a file needs is imported, so
+# converting a CSV never loads fitz, python-docx or pytesseract.
+
+# Imports worth knowing about when looking at start up time
+HEAVY_MODULES = ('fitz', 'docx', 'pytesseract', 'pandas', 'lxml', 'jinja2', 'PIL', 'pyarrow')
+
+# Options that only mean something to some formats
+FORMAT_OPTIONS = {
+    'docx': ('images', 'theme', 'reuse_fragments'),
+    'pdf': ('images', 'ocr', 'workers', 'theme'),
+}
+
+
+def iter_inputs(inputs):
+    # Files as given, directories expanded to the supported files directly inside them
+    for path in inputs:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if os.path.splitext(filename)[1].lower() in converters.FORMATS_BY_EXTENSION:
+                    yield os.path.join(path, filename)
+        else:
+            yield path
+
+
+def convert_all(inputs, output_folder, format=None, **options):
+    """Convert every input with the converter for its type into output_folder.
+    Returns (converted paths, failed inputs) and carries on past failures."""
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    written, failed = [], []
+    for input_path in iter_inputs(inputs):
+        try:
+            input_format = format or converters.format_for(input_path)
+            allowed = FORMAT_OPTIONS.get(input_format, ())
+            output_path = converters.output_path_for(input_path, output_folder, input_format)
+            converters.convert(input_path, output_path, input_format,
+                               **{name: value for name, value in options.items() if name in allowed})
+            written.append(output_path)
+            print(f"Converted {input_path} to {output_path}")
+        except Exception as e:
+            failed.append(input_path)
+            print(f"Failed to convert {input_path}: {e}")
+    return written, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert docx, pdf, csv/xlsx/parquet, images, md or html files to HTML')
+    parser.add_argument('inputs', nargs='+', help='files or directories of files')
+    parser.add_argument('-o', '--output-folder', default='output')
+    parser.add_argument('--format', choices=sorted(converters.CONVERTERS), default=None,
+                        help='convert everything as this format instead of going by the extension')
+    parser.add_argument('--no-images', action='store_true', help='docx/pdf: leave the images out')
+    parser.add_argument('--no-ocr', action='store_true', help='pdf: only use the text layer')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='pdf: worker processes per document (0 for one per core)')
+    parser.add_argument('--theme', choices=THEMES, default=None, help='docx/pdf: page template in templates/')
+    parser.add_argument('--reuse-fragments', action='store_true',
+                        help='docx: reuse the HTML of paragraphs and tables already converted in another document')
+    parser.add_argument('--timings', action='store_true',
+                        help='print start up, import and conversion times and the heavy modules loaded')
+    args = parser.parse_args()
+
+    imported = time.perf_counter()
+    if args.timings:
+        # Import the backends first so their cost is reported on its own
+        extensions = (os.path.splitext(path)[1].lower() for path in iter_inputs(args.inputs))
+        converters.warm({args.format} if args.format else
+                        {converters.FORMATS_BY_EXTENSION[e] for e in extensions if e in converters.FORMATS_BY_EXTENSION})
+    warmed = time.perf_counter()
+    options = {'theme': args.theme} if args.theme else {}
+    written, failed = convert_all(args.inputs, args.output_folder, args.format, images=not args.no_images,
+                                  ocr=not args.no_ocr, workers=args.workers or None, reuse_fragments=args.reuse_fragments,
+                                  **options)
+    if args.timings:
+        finished = time.perf_counter()
+        print(f"Start up {(imported - _STARTED) * 1000:.1f} ms, backend imports {(warmed - imported) * 1000:.1f} ms, "
+              f"conversion {(finished - warmed) * 1000:.1f} ms")
+        print(f"Heavy modules loaded: {', '.join(m for m in HEAVY_MODULES if m in sys.modules) or 'none'}")
+    sys.exit(1 if failed else 0)
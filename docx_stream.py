@@ -0,0 +1,238 @@
+import argparse
+import os
+import posixpath
+import time
+import tracemalloc
+import zipfile
+from collections import namedtuple
+from lxml import etree
+from main2 import (format_contents_paragraph, format_paragraph, fragment_index, paragraph_html, paragraph_key,
+                   reuse_fragment)
+from html_writer import stream_template
+from templates import DEFAULT_THEME, THEMES, get_template
+from assets import ASSET_FOLDER, AssetStore
+from docx_table import format_table
+from docx_styles import DocumentIndex, close_lists
+from docx_xml import BODY, P, R, TBL, W, on_off, paragraph_images, paragraph_text, run_text, underline
+import instrumentation
+
+# Reads word/document.xml straight out of the .docx with iterparse instead of
+# building the python-docx object tree. Produces the same HTML as
+# main2.iter_word_file: paragraphs go through main2.format_paragraph via the
+# small stand-in objects below, tables go through docx_table like main2's.
+
+RELATIONSHIP_TYPES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+OFFICE_DOCUMENT = RELATIONSHIP_TYPES + 'officeDocument'
+STYLES = RELATIONSHIP_TYPES + 'styles'
+NUMBERING = RELATIONSHIP_TYPES + 'numbering'
+
+# The parts of python-docx's Paragraph/Run that main2.format_paragraph uses
+Run = namedtuple('Run', ['text', 'bold', 'italic', 'underline'])
+StreamParagraph = namedtuple('StreamParagraph', ['text', 'runs'])
+
+
+def _runs(p):
+    # paragraph.runs only has the runs directly in the paragraph, not those in hyperlinks
+    runs = []
+    for r in p.iterchildren(R):
+        rPr = r.find(W + 'rPr')
+        if rPr is None:
+            runs.append(Run(run_text(r), None, None, None))
+        else:
+            runs.append(Run(run_text(r), on_off(rPr, 'b'), on_off(rPr, 'i'), underline(rPr)))
+    return runs
+
+
+def _relationships(archive, rels_path, base):
+    # Relationship id -> (type, path of the part in the archive) from a .rels file,
+    # external targets left out
+    try:
+        rels = etree.fromstring(archive.read(rels_path))
+    except KeyError:
+        return {}
+    return {rel.get('Id'): (rel.get('Type'), posixpath.normpath(posixpath.join(base, rel.get('Target'))).lstrip('/'))
+            for rel in rels if rel.get('TargetMode') != 'External'}
+
+
+def _part_path(relationships, relationship_type):
+    # The part the first relationship of that type points at
+    for rel_type, path in relationships.values():
+        if rel_type == relationship_type:
+            return path
+    return None
+
+
+def image_tags(p, archive, relationships, assets):
+    # <img> tags for the pictures in a paragraph, like main2.image_tags
+    tags = []
+    for rel_id, display in paragraph_images(p):
+        try:
+            data = archive.read(relationships[rel_id][1])
+        except KeyError:
+            continue
+        tags.append(assets.img_tag(data, display))
+    return ''.join(tags)
+
+
+def _default_styles_xml():
+    # python-docx falls back to its own styles when a document has none
+    from docx.parts.styles import StylesPart
+    return StylesPart._default_styles_xml()
+
+
+def iter_word_file(file_path, assets=None, fragments=None):
+    # Yields the HTML fragments of the document one at a time, like main2.iter_word_file,
+    # while only one body element is held in memory. fragments is a
+    # fragments.FragmentIndex shared with main2, see main2.iter_word_file.
+    with zipfile.ZipFile(file_path) as archive, instrumentation.span('docx.open'):
+        document_path = _part_path(_relationships(archive, '_rels/.rels', '/'), OFFICE_DOCUMENT) or 'word/document.xml'
+        document_dir, document_name = posixpath.split(document_path)
+        relationships = _relationships(archive, posixpath.join(document_dir, '_rels', document_name + '.rels'),
+                                       '/' + document_dir)
+        parts = {}
+        for name, relationship_type in (('styles', STYLES), ('numbering', NUMBERING)):
+            part_path = _part_path(relationships, relationship_type)
+            try:
+                parts[name] = etree.fromstring(archive.read(part_path)) if part_path else None
+            except KeyError:
+                parts[name] = None
+        if parts['styles'] is None:
+            parts['styles'] = etree.fromstring(_default_styles_xml())
+        index = DocumentIndex(parts['styles'], parts['numbering'])
+
+    if fragments is not None:
+        fragments.begin_document()
+    is_contents_page = False
+    list_stack = []  # Types of the lists open now, outermost first
+
+    with zipfile.ZipFile(file_path) as archive, archive.open(document_path) as document:
+        for _, element in etree.iterparse(document, events=('end',), tag=(P, TBL), huge_tree=True):
+            body = element.getparent()
+            if body is None or body.tag != BODY:
+                continue  # paragraphs inside tables are read with their table
+
+            if element.tag == TBL:
+                formatted_table = reuse_fragment(fragments, element, 'table', lambda: format_table(element))
+                if formatted_table.strip():  # Ensure non-empty table
+                    instrumentation.count('tables')
+                    if list_stack:
+                        # A table straight after a list item would otherwise land inside its <li>
+                        yield close_lists(list_stack)
+                    yield formatted_table
+                    yield '<br>'  # Add a break after each table
+            else:
+                instrumentation.count('paragraphs')
+                info = index.paragraph(element)
+                key = paragraph_key(fragments, element, info) if fragments is not None and not is_contents_page else None
+                html = fragments.get(key) if key else None
+                if html is not None:
+                    # Only non-empty paragraphs outside the contents are stored
+                    formatted_paragraph = format_paragraph(None, list_stack, info, html)
+                    if formatted_paragraph.strip():
+                        yield formatted_paragraph
+                else:
+                    text = paragraph_text(element)
+                    if text.strip():
+                        paragraph = StreamParagraph(text, _runs(element))
+                        if "CONTENTS" in text.upper():
+                            is_contents_page = True
+                            if list_stack:
+                                yield close_lists(list_stack)
+                            yield '<h1 style="text-align: center;">CONTENTS</h1>'
+                        elif is_contents_page:
+                            formatted_paragraph = format_contents_paragraph(paragraph)
+                            if formatted_paragraph.strip():  # Ensure non-empty paragraph
+                                yield formatted_paragraph
+                        else:
+                            html = paragraph_html(paragraph, info)
+                            if key:
+                                fragments.put(key, 'paragraph', html)
+                            formatted_paragraph = format_paragraph(paragraph, list_stack, info, html)
+                            if formatted_paragraph.strip():  # Ensure non-empty paragraph
+                                yield formatted_paragraph
+                if assets is not None:
+                    images = image_tags(element, archive, relationships, assets)
+                    if images:
+                        yield f'<p>{images}</p>'
+
+            # Drop the element and everything before it in the body
+            element.clear()
+            while element.getprevious() is not None:
+                del body[0]
+
+        # Close any remaining open lists
+        if list_stack:
+            yield close_lists(list_stack)
+    if fragments is not None:
+        fragments.end_document(os.path.abspath(file_path))
+
+
+def read_word_file(file_path):
+    try:
+        return list(iter_word_file(file_path))
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return []
+
+
+def convert_file(file_path, output_path, images=True, image_workers=None, theme=DEFAULT_THEME,
+                 reuse_fragments=False):
+    # Same page as main2 writes, returns the number of fragments. Images go to the
+    # assets folder next to output_path, encoded by image_workers processes (0 for
+    # this one).
+    template = get_template(theme)
+    fragments = fragment_index() if reuse_fragments else None
+    if not images:
+        return stream_template(template, output_path, iter_word_file(file_path, fragments=fragments),
+                               filename=os.path.basename(file_path))
+    with AssetStore(os.path.join(os.path.dirname(os.path.abspath(output_path)), ASSET_FOLDER),
+                    workers=image_workers) as assets:
+        return stream_template(template, output_path, iter_word_file(file_path, assets, fragments),
+                               filename=os.path.basename(file_path))
+
+
+def _measure(reader, file_path):
+    start = time.perf_counter()
+    reader(file_path)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    reader(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark(file_path):
+    """Time and peak memory of main2.read_word_file against this reader. Also checks
+    the two produce the same fragments."""
+    import main2
+
+    if main2.read_word_file(file_path) != read_word_file(file_path):
+        print("Warning: the readers produced different HTML")
+    old_seconds, old_peak = _measure(main2.read_word_file, file_path)
+    new_seconds, new_peak = _measure(read_word_file, file_path)
+    print(f"python-docx: {old_seconds * 1000:.1f} ms, {old_peak / 1024 / 1024:.1f} MB peak")
+    print(f"stream:      {new_seconds * 1000:.1f} ms, {new_peak / 1024 / 1024:.1f} MB peak "
+          f"({old_seconds / new_seconds:.1f}x faster, {old_peak / max(new_peak, 1):.1f}x less memory)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a .docx to HTML without building the python-docx object tree')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default=None)
+    parser.add_argument('--benchmark', action='store_true', help='compare against main2.read_word_file')
+    parser.add_argument('--no-images', action='store_true', help='leave the images out of the HTML')
+    parser.add_argument('--theme', choices=THEMES, default=DEFAULT_THEME, help='page template in templates/')
+    parser.add_argument('--reuse-fragments', action='store_true',
+                        help='reuse the HTML of paragraphs and tables already converted in another document')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.input_file)
+    else:
+        output_file = args.output_file or f"{os.path.splitext(args.input_file)[0]}.html"
+        if convert_file(args.input_file, output_file, images=not args.no_images, theme=args.theme,
+                        reuse_fragments=args.reuse_fragments):
+            print(f"Converted {args.input_file} to {output_file}")
+        else:
+            print(f"Failed to read the file: {args.input_file}")
@@ -0,0 +1,202 @@
+import re
+from collections import namedtuple
+from docx_xml import ON_VALUES, VAL, W
+
+# python-docx shows these built-in style names capitalised
+UI_STYLE_NAMES = {'caption': 'Caption', 'footer': 'Footer', 'header': 'Header',
+                  **{f'heading {n}': f'Heading {n}' for n in range(1, 10)}}
+
+# Styles that are lists by name even when they carry no numbering of their own
+LIST_STYLE_PREFIXES = (('List Bullet', 'ul'), ('List Number', 'ol'))
+
+# How deep basedOn chains are followed, they should never loop but files are files
+MAX_BASED_ON = 20
+
+# What format_paragraph needs to know about a paragraph. heading_level is 1-9 or
+# None, list_type 'ul'/'ol' or None, depth is the list nesting level from 0.
+ParagraphInfo = namedtuple('ParagraphInfo', ['style_name', 'heading_level', 'list_type', 'depth'])
+PLAIN = ParagraphInfo(None, None, None, 0)
+
+# Raw w:style data before basedOn is resolved
+_RawStyle = namedtuple('_RawStyle', ['name', 'based_on', 'num', 'outline'])
+
+
+def _num_pr(pPr):
+    # (numId, ilvl) of a w:numPr, either part may be None
+    numPr = None if pPr is None else pPr.find(W + 'numPr')
+    if numPr is None:
+        return None
+    num_id = numPr.find(W + 'numId')
+    ilvl = numPr.find(W + 'ilvl')
+    return (None if num_id is None else num_id.get(VAL),
+            None if ilvl is None else int(ilvl.get(VAL, 0)))
+
+
+def _list_type(num_fmt):
+    # Bullets are <ul>, every numbering format is <ol>, 'none' shows no marker at all
+    if num_fmt == 'bullet':
+        return 'ul'
+    if num_fmt == 'none':
+        return None
+    return 'ol'
+
+
+def _levels(parent):
+    # ilvl -> numFmt of the w:lvl children
+    levels = {}
+    for lvl in parent.iterchildren(W + 'lvl'):
+        num_fmt = lvl.find(W + 'numFmt')
+        levels[int(lvl.get(W + 'ilvl', 0))] = 'decimal' if num_fmt is None else num_fmt.get(VAL)
+    return levels
+
+
+class DocumentIndex:
+    """Heading levels and list types of one document, read once from the root
+    elements of styles.xml and numbering.xml (either can be None).
+
+    paragraph(p) then answers for any w:p with a few dict lookups instead of
+    resolving the style through python-docx for every paragraph. Unknown style
+    ids fall back to the default paragraph style, as in python-docx.
+    """
+
+    def __init__(self, styles=None, numbering=None):
+        raw = self._read_styles(styles)
+        self.lists = self._read_numbering(numbering, raw)  # (numId, ilvl) -> 'ul'/'ol'/None
+        self.style_nums = {}  # style id -> (numId, ilvl) the style numbers its paragraphs with
+        self.styles = {}  # style id -> ParagraphInfo
+        for style_id, style in raw.items():
+            self.styles[style_id] = self._style_info(style_id, style, raw)
+
+    def _read_styles(self, styles):
+        raw = {}
+        self.default_id = None
+        if styles is None:
+            return raw
+        for style in styles.iterchildren(W + 'style'):
+            if style.get(W + 'type') != 'paragraph':
+                continue
+            style_id = style.get(W + 'styleId')
+            name = style.find(W + 'name')
+            name = None if name is None else name.get(VAL)
+            based_on = style.find(W + 'basedOn')
+            pPr = style.find(W + 'pPr')
+            outline = None if pPr is None else pPr.find(W + 'outlineLvl')
+            raw[style_id] = _RawStyle(UI_STYLE_NAMES.get(name, name),
+                                      None if based_on is None else based_on.get(VAL),
+                                      _num_pr(pPr),
+                                      None if outline is None else int(outline.get(VAL)))
+            if style.get(W + 'default', 'false') in ON_VALUES:
+                self.default_id = style_id  # the last default wins
+        return raw
+
+    def _read_numbering(self, numbering, raw):
+        lists = {}
+        if numbering is None:
+            return lists
+        abstracts = {}  # abstractNumId -> (levels, numStyleLink style id)
+        for abstract in numbering.iterchildren(W + 'abstractNum'):
+            link = abstract.find(W + 'numStyleLink')
+            abstracts[abstract.get(W + 'abstractNumId')] = (_levels(abstract),
+                                                            None if link is None else link.get(VAL))
+        nums = {}  # numId -> (abstractNumId, overridden levels)
+        for num in numbering.iterchildren(W + 'num'):
+            abstract_id = num.find(W + 'abstractNumId')
+            overrides = {}
+            for override in num.iterchildren(W + 'lvlOverride'):
+                overrides.update(_levels(override))
+            nums[num.get(W + 'numId')] = (None if abstract_id is None else abstract_id.get(VAL), overrides)
+
+        for num_id, (abstract_id, overrides) in nums.items():
+            levels, link = abstracts.get(abstract_id, ({}, None))
+            if not levels and link in raw:
+                # A list style: the levels are in the numbering the style points at
+                linked_num = (self._inherited(link, raw, 'num') or (None, None))[0]
+                levels = abstracts.get(nums.get(linked_num, (None,))[0], ({}, None))[0]
+            for ilvl, num_fmt in {**levels, **overrides}.items():
+                lists[num_id, ilvl] = _list_type(num_fmt)
+        return lists
+
+    def _inherited(self, style_id, raw, field):
+        # The first style up the basedOn chain that sets field
+        for _ in range(MAX_BASED_ON):
+            style = raw.get(style_id)
+            if style is None:
+                return None
+            value = getattr(style, field)
+            if value is not None:
+                return value
+            style_id = style.based_on
+        return None
+
+    def _style_info(self, style_id, style, raw):
+        name = style.name or ''
+        heading = re.match(r'Heading (\d)$', name)
+        if heading:
+            heading_level = int(heading.group(1))
+        elif name.startswith('Heading'):
+            heading_level = 1
+        else:
+            outline = self._inherited(style_id, raw, 'outline')
+            heading_level = outline + 1 if outline is not None and outline < 9 else None
+        if heading_level:
+            # A numbered heading is still a heading, not a list item
+            return ParagraphInfo(style.name, heading_level, None, 0)
+
+        # 'List Bullet 2' is the second level even though Word's built-in list
+        # styles each number their own single level list
+        name_list_type, name_depth = None, 0
+        for prefix, list_type in LIST_STYLE_PREFIXES:
+            if name.startswith(prefix):
+                level = name[len(prefix):].strip()
+                name_list_type, name_depth = list_type, int(level) - 1 if level.isdigit() else 0
+
+        num = self._inherited(style_id, raw, 'num')
+        if num is not None:
+            num_id, ilvl = num[0], num[1] or 0
+            self.style_nums[style_id] = (num_id, ilvl)
+            list_type = self.lists.get((num_id, ilvl))
+            if list_type:
+                return ParagraphInfo(style.name, None, list_type, max(ilvl, name_depth))
+        return ParagraphInfo(style.name, None, name_list_type, name_depth if name_list_type else 0)
+
+    def paragraph(self, p):
+        # ParagraphInfo of a w:p, its own numPr wins over its style's
+        pPr = p.find(W + 'pPr')
+        style_id = None
+        if pPr is not None:
+            pStyle = pPr.find(W + 'pStyle')
+            style_id = None if pStyle is None else pStyle.get(VAL)
+        if style_id not in self.styles:
+            style_id = self.default_id
+        info = self.styles.get(style_id, PLAIN)
+
+        num = _num_pr(pPr)
+        if num is None or info.heading_level:
+            return info
+        style_num = self.style_nums.get(style_id, (None, 0))
+        num_id = num[0] if num[0] is not None else style_num[0]
+        ilvl = num[1] if num[1] is not None else style_num[1]
+        list_type = self.lists.get((num_id, ilvl))
+        return info._replace(list_type=list_type, depth=ilvl if list_type else 0)
+
+
+def open_list(list_stack, list_type, depth):
+    """The markup that takes the open lists in list_stack to a new item of a
+    list_type list at depth (0 is the top level). The item's <li> is left open so
+    a deeper list can still go inside it; close_lists closes everything."""
+    html = ''
+    while len(list_stack) > depth + 1 or (len(list_stack) == depth + 1 and list_stack[-1] != list_type):
+        html += f'</li></{list_stack.pop()}>'
+    if len(list_stack) == depth + 1:
+        return html + '</li><li>'
+    while len(list_stack) <= depth:
+        list_stack.append(list_type)
+        html += f'<{list_type}><li>'
+    return html
+
+
+def close_lists(list_stack):
+    html = ''
+    while list_stack:
+        html += f'</li></{list_stack.pop()}>'
+    return html
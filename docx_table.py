@@ -0,0 +1,72 @@
+from docx_xml import P, TC, TR, VAL, W, int_val, paragraph_text
+import instrumentation
+
+TABLE_START = '<table style="border-collapse: collapse; border: 1px solid black; background-color: lightgray; width:100%;">'
+CELL_STYLE = 'border: 1px solid black; padding: 5px;'
+
+
+class Cell:
+    __slots__ = ('text', 'colspan', 'rowspan')
+
+    def __init__(self, text, colspan):
+        self.text = text
+        self.colspan = colspan
+        self.rowspan = 1
+
+
+def table_grid(tbl):
+    """Resolve a w:tbl element into rows of Cells in one pass.
+
+    gridSpan becomes colspan. A vMerge="continue" cell is folded into the cell
+    above it in the same grid column, whose rowspan grows by one. Each w:tc is
+    visited once, so the cost is linear in the number of cells. Works on
+    python-docx's table._tbl as well as elements from docx_stream.
+    """
+    rows = []
+    open_cells = {}  # grid column -> cell a vMerge="continue" below it extends
+    for tr in tbl.iterchildren(TR):
+        trPr = tr.find(W + 'trPr')
+        column = 0 if trPr is None else int_val(trPr, 'gridBefore', 0)
+        cells = []
+        still_open = {}
+        for tc in tr.iterchildren(TC):
+            tcPr = tc.find(W + 'tcPr')
+            colspan, vmerge = 1, None
+            if tcPr is not None:
+                colspan = int_val(tcPr, 'gridSpan', 1)
+                vMerge = tcPr.find(W + 'vMerge')
+                if vMerge is not None:
+                    vmerge = vMerge.get(VAL, 'continue')
+
+            above = open_cells.get(column)
+            if vmerge == 'continue' and above is not None and above.colspan == colspan:
+                above.rowspan += 1
+                still_open[column] = above
+            else:
+                cell = Cell('\n'.join(paragraph_text(p) for p in tc.iterchildren(P)).strip(), colspan)
+                cells.append(cell)
+                if vmerge is not None:
+                    still_open[column] = cell
+            column += colspan
+        # A merge only carries on into the next row if this row continued it
+        open_cells = still_open
+        rows.append(cells)
+    return rows
+
+
+def format_table(tbl):
+    # The w:tbl element as an HTML table with real colspan/rowspan
+    with instrumentation.span('docx.table'):
+        parts = [TABLE_START]
+        for cells in table_grid(tbl):
+            parts.append('<tr>')
+            for cell in cells:
+                spans = ''
+                if cell.colspan > 1:
+                    spans += f' colspan="{cell.colspan}"'
+                if cell.rowspan > 1:
+                    spans += f' rowspan="{cell.rowspan}"'
+                parts.append(f'<td{spans} style="{CELL_STYLE}">{cell.text}</td>')
+            parts.append('</tr>')
+        parts.append('</table>')
+        return ''.join(parts)
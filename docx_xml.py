@@ -0,0 +1,96 @@
+# Helpers for reading WordprocessingML elements with plain lxml, giving the same
+# values python-docx would. Shared by docx_stream, docx_table and main2.
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+BODY = W + 'body'
+P = W + 'p'
+TBL = W + 'tbl'
+TR = W + 'tr'
+TC = W + 'tc'
+R = W + 'r'
+HYPERLINK = W + 'hyperlink'
+VAL = W + 'val'
+
+ON_VALUES = ('1', 'true', 'on')
+
+
+def run_text(r):
+    # Same as python-docx's run.text: tabs, breaks and no-break hyphens become text
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == W + 't':
+            parts.append(child.text or '')
+        elif tag in (W + 'tab', W + 'ptab'):
+            parts.append('\t')
+        elif tag == W + 'br':
+            parts.append('\n' if child.get(W + 'type', 'textWrapping') == 'textWrapping' else '')
+        elif tag == W + 'cr':
+            parts.append('\n')
+        elif tag == W + 'noBreakHyphen':
+            parts.append('-')
+    return ''.join(parts)
+
+
+def paragraph_text(p):
+    # Runs and hyperlinks directly in the paragraph, like python-docx's paragraph.text
+    parts = []
+    for child in p:
+        if child.tag == R:
+            parts.append(run_text(child))
+        elif child.tag == HYPERLINK:
+            parts.extend(run_text(r) for r in child.iterchildren(R))
+    return ''.join(parts)
+
+
+def on_off(parent, name):
+    # <w:b/> is on, <w:b w:val="0"/> off, no element at all is None (inherited)
+    element = parent.find(W + name)
+    if element is None:
+        return None
+    return element.get(VAL, 'true') in ON_VALUES
+
+
+def underline(rPr):
+    element = rPr.find(W + 'u')
+    if element is None:
+        return None
+    val = element.get(VAL)
+    if val is None:
+        return None
+    return val != 'none'
+
+
+def int_val(parent, path, default):
+    # w:val of a child element as an int, e.g. int_val(tcPr, 'gridSpan', 1)
+    element = parent.find(W + path)
+    if element is None or element.get(VAL) is None:
+        return default
+    return int(element.get(VAL))
+
+
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+WP = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}'
+V = '{urn:schemas-microsoft-com:vml}'
+REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+EMU_PER_PIXEL = 9525  # English Metric Units in a CSS pixel
+
+
+def paragraph_images(p):
+    # (relationship id, (width, height) in CSS pixels or None) of every image
+    # embedded in the paragraph, DrawingML pictures and old VML ones
+    images = []
+    for blip in p.iter(A + 'blip', V + 'imagedata'):
+        rel_id = blip.get(REL + 'embed') if blip.tag == A + 'blip' else blip.get(REL + 'id')
+        if not rel_id:
+            continue  # linked, not embedded
+        display = None
+        for drawing in blip.iterancestors(WP + 'inline', WP + 'anchor'):
+            extent = drawing.find(WP + 'extent')
+            if extent is not None:
+                display = (int(extent.get('cx', 0)) / EMU_PER_PIXEL, int(extent.get('cy', 0)) / EMU_PER_PIXEL)
+                display = display if min(display) > 0 else None
+            break
+        images.append((rel_id, display))
+    return images
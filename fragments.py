@@ -0,0 +1,169 @@
+import argparse
+import functools
+import hashlib
+import os
+import re
+import sqlite3
+from collections import Counter
+
+from lxml import etree
+
+from cache import DEFAULT_CACHE_DIR
+import instrumentation
+
+# Index of the paragraphs and tables of every converted .docx, by a fingerprint
+# of their XML. Legal documents share a lot of boilerplate, so a block already
+# rendered for an earlier document has its HTML looked up instead of rendered
+# again, and the index can report which clauses turn up in the most documents.
+
+DEFAULT_INDEX_PATH = os.path.join(DEFAULT_CACHE_DIR, 'fragments.sqlite')
+
+# XML that differs between copies of the same clause but never changes the HTML:
+# revision ids, Word's paragraph ids, namespace declarations inherited from the
+# document, spelling marks and bookmarks (e.g. the _Toc anchors)
+NOISE_PATTERN = re.compile(rb'\s(?:w:rsid\w*|w14:paraId|w14:textId|xmlns:\w+)="[^"]*"'
+                           rb'|<w:(?:proofErr|bookmarkStart|bookmarkEnd)\b[^>]*/>')
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fragments (
+    fingerprint TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    version TEXT NOT NULL,
+    html TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uses (
+    fingerprint TEXT NOT NULL,
+    document TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (fingerprint, document)
+);
+"""
+
+
+class FragmentIndex:
+    """Rendered HTML of docx paragraphs and tables in sqlite, keyed by fingerprint().
+
+    version identifies the renderer: fragments stored by another version are
+    rendered again and replaced. Lookups and new fragments are only written at
+    end_document(), in one transaction, so several worker processes can share
+    the same index file.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, version=''):
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.bytes_reused = 0  # HTML that did not need rendering
+        self._new = {}  # fingerprint -> (kind, html) not written yet
+        self._uses = Counter()  # fingerprint -> times used in the current document
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def fingerprint(self, element, *context):
+        # Hash of the element's XML without the noise above, plus anything else
+        # the HTML depends on (e.g. the paragraph's heading level from its style)
+        digest = hashlib.sha256(NOISE_PATTERN.sub(b'', etree.tostring(element)))
+        digest.update(repr(context).encode('utf-8'))
+        return digest.hexdigest()
+
+    def begin_document(self):
+        # Forget the uses of a document that failed halfway; its new fragments are kept
+        self._uses.clear()
+
+    def get(self, fingerprint):
+        # The stored HTML or None, counting the block as used by this document
+        with instrumentation.span('fragments.get'):
+            new = self._new.get(fingerprint)
+            if new is not None:
+                html = new[1]
+            else:
+                row = self.connection.execute('SELECT html FROM fragments WHERE fingerprint = ? AND version = ?',
+                                              (fingerprint, self.version)).fetchone()
+                html = row[0] if row else None
+        if html is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_reused += len(html)
+        self._uses[fingerprint] += 1
+        return html
+
+    def put(self, fingerprint, kind, html):
+        # A block rendered after get() missed; kind is 'paragraph' or 'table'
+        self._new[fingerprint] = (kind, html)
+        self._uses[fingerprint] += 1
+
+    def end_document(self, document):
+        # Write the new fragments and which blocks document used
+        with instrumentation.span('fragments.write'), self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO fragments (fingerprint, kind, version, html) VALUES (?, ?, ?, ?)',
+                [(fingerprint, kind, self.version, html) for fingerprint, (kind, html) in self._new.items()])
+            self.connection.execute('DELETE FROM uses WHERE document = ?', (document,))
+            self.connection.executemany('INSERT INTO uses (fingerprint, document, count) VALUES (?, ?, ?)',
+                                        [(fingerprint, document, count) for fingerprint, count in self._uses.items()])
+        self._new.clear()
+        self._uses.clear()
+
+    def most_shared(self, limit=20):
+        # (kind, documents, uses, html) of the blocks in the most documents
+        return self.connection.execute(
+            'SELECT f.kind, COUNT(*) AS documents, SUM(u.count) AS uses, f.html FROM uses u '
+            'JOIN fragments f ON f.fingerprint = u.fingerprint '
+            'GROUP BY u.fingerprint HAVING documents > 1 ORDER BY documents DESC, uses DESC LIMIT ?',
+            (limit,)).fetchall()
+
+    def totals(self):
+        # (fragments, documents, fragments used by more than one document)
+        fragments = self.connection.execute('SELECT COUNT(*) FROM fragments').fetchone()[0]
+        documents = self.connection.execute('SELECT COUNT(DISTINCT document) FROM uses').fetchone()[0]
+        shared = self.connection.execute('SELECT COUNT(*) FROM (SELECT fingerprint FROM uses '
+                                         'GROUP BY fingerprint HAVING COUNT(*) > 1)').fetchone()[0]
+        return fragments, documents, shared
+
+    def report(self):
+        fragments, documents, shared = self.totals()
+        lookups = self.hits + self.misses
+        reused = (f"{self.hits} of {lookups} blocks reused ({self.hits / lookups * 100:.0f}%), "
+                  f"{self.bytes_reused / 1024 / 1024:.1f} MB of HTML, " if lookups else '')
+        return (f"Fragments: {reused}{fragments} fragments from {documents} documents in {self.path}, "
+                f"{shared} shared by more than one document")
+
+    def close(self):
+        self.connection.close()
+
+
+@functools.lru_cache(maxsize=None)
+def shared_index(path=DEFAULT_INDEX_PATH, version=''):
+    # One FragmentIndex per process, for batch workers converting a file at a time
+    return FragmentIndex(path, version)
+
+
+def summary(html, width=100):
+    # The text of a fragment on one line, for the report
+    text = ' '.join(TAG_PATTERN.sub(' ', html).split())
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def print_report(path=DEFAULT_INDEX_PATH, limit=20):
+    index = FragmentIndex(path)
+    try:
+        fragments, documents, shared = index.totals()
+        print(f"{fragments} fragments from {documents} documents, {shared} shared by more than one document")
+        for kind, document_count, uses, html in index.most_shared(limit):
+            print(f"{document_count:6} docs {uses:7} uses  {kind:9}  {summary(html)}")
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show the clauses shared by the most converted documents')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help='fragment index to read')
+    parser.add_argument('--top', type=int, default=20, help='number of clauses to list')
+    args = parser.parse_args()
+    print_report(args.index, args.top)
@@ -0,0 +1,63 @@
+import os
+
+import instrumentation
+
+
+class _Counted:
+    # Wraps the fragment iterable to know afterwards whether anything came out of it
+    def __init__(self, fragments):
+        self.fragments = fragments
+        self.count = 0
+
+    def __iter__(self):
+        for fragment in self.fragments:
+            self.count += 1
+            yield fragment
+
+
+class _TimedFile:
+    # Times the writes on their own when instrumentation is on, so file.write and
+    # template.render (which includes producing the fragments) can be told apart
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, text):
+        with instrumentation.span('file.write'):
+            self.f.write(text)
+
+    def writelines(self, lines):
+        for text in lines:
+            self.write(text)
+
+
+def stream_template(template, output_path, content, **context):
+    """Render a jinja2 template to output_path while content is still being produced.
+
+    content can be any iterable of HTML fragments, normally a reader's generator,
+    so nothing but the fragment being written is held in memory. The page goes
+    to a .part file that replaces output_path once rendering finishes; if the
+    reader raises or yields nothing the .part file is removed and the old output
+    (if any) stays. Returns the number of fragments written.
+
+    Recorded as the template.render span, which covers the whole streamed
+    conversion since the fragments are produced while the page is written.
+    """
+    fragments = _Counted(content)
+    part_path = output_path + '.part'
+    try:
+        with instrumentation.span('template.render'), open(part_path, 'w', encoding='utf-8') as f:
+            if instrumentation.enabled():
+                f = _TimedFile(f)
+            template.stream(content=fragments, **context).dump(f)
+    except BaseException:
+        # open() itself may have failed, and the original error is the one to report
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    if not fragments.count:
+        os.remove(part_path)
+        return 0
+    instrumentation.count('bytes_out', os.path.getsize(part_path))
+    os.replace(part_path, output_path)
+    return fragments.count
@@ -0,0 +1,197 @@
+import atexit
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Setting this to a file path turns the metrics on for any of the converters.
+# Files ending in .prom get the Prometheus text format, anything else JSON lines.
+METRICS_ENV = 'CONVERTER_METRICS'
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+_enabled = False
+_output = None
+_owner_pid = None
+_spans = {}  # name -> [calls, total seconds, max seconds, peak rss growth in bytes]
+_counters = {}  # name -> value
+
+
+def _peak_rss():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE
+
+
+class _NullSpan:
+    # Shared do-nothing span handed out while instrumentation is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'start', 'rss')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.rss = _peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stats = _spans.get(self.name)
+        if stats is None:
+            stats = _spans[self.name] = [0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        # How much this stage pushed up the peak memory of the process
+        stats[3] += _peak_rss() - self.rss
+        return False
+
+
+def span(name):
+    """Time a stage: with span('pdf.page'): ...
+
+    Spans are aggregated by name (calls, total and max seconds, peak memory
+    growth). While instrumentation is off this returns a shared no-op object,
+    so leaving spans in hot loops costs one function call.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def count(name, value=1):
+    # Add value to a counter (pages, paragraphs, tables, bytes_out...)
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def enabled():
+    return _enabled
+
+
+def enable(output=None):
+    """Start recording. With an output path the metrics are written there when
+    the process exits (call write() to write them earlier)."""
+    global _enabled, _output, _owner_pid
+    _enabled = True
+    if output:
+        if _output is None:
+            atexit.register(_write_at_exit)
+        _output = output
+        _owner_pid = os.getpid()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    _spans.clear()
+    _counters.clear()
+
+
+def collect():
+    """Return and clear everything recorded in this process, so worker processes
+    can send their numbers back to the parent, which passes them to merge()."""
+    data = {'spans': dict(_spans), 'counters': dict(_counters)}
+    reset()
+    return data
+
+
+def merge(data):
+    for name, (calls, total, longest, growth) in data['spans'].items():
+        stats = _spans.setdefault(name, [0, 0.0, 0.0, 0])
+        stats[0] += calls
+        stats[1] += total
+        stats[2] = max(stats[2], longest)
+        stats[3] += growth
+    for name, value in data['counters'].items():
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def json_lines():
+    # One line per span and counter plus one for the process
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    pid = os.getpid()
+    lines = []
+    for name, (calls, total, longest, growth) in sorted(_spans.items()):
+        lines.append(json.dumps({'time': now, 'pid': pid, 'type': 'span', 'name': name, 'calls': calls,
+                                 'seconds': round(total, 6), 'max_seconds': round(longest, 6),
+                                 'peak_rss_growth_bytes': growth}))
+    for name, value in sorted(_counters.items()):
+        lines.append(json.dumps({'time': now, 'pid': pid, 'type': 'counter', 'name': name, 'value': value}))
+    lines.append(json.dumps({'time': now, 'pid': pid, 'type': 'process', 'peak_rss_bytes': _peak_rss()}))
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_text():
+    # Text exposition format, e.g. for the node_exporter textfile collector
+    lines = [
+        '# HELP converter_span_seconds_total Time spent in each conversion stage.',
+        '# TYPE converter_span_seconds_total counter',
+    ]
+    lines += [f'converter_span_seconds_total{{span="{name}"}} {stats[1]:.6f}' for name, stats in sorted(_spans.items())]
+    lines += ['# HELP converter_span_calls_total Number of times each stage ran.',
+              '# TYPE converter_span_calls_total counter']
+    lines += [f'converter_span_calls_total{{span="{name}"}} {stats[0]}' for name, stats in sorted(_spans.items())]
+    lines += ['# HELP converter_span_max_seconds Longest single run of each stage.',
+              '# TYPE converter_span_max_seconds gauge']
+    lines += [f'converter_span_max_seconds{{span="{name}"}} {stats[2]:.6f}' for name, stats in sorted(_spans.items())]
+    lines += ['# HELP converter_span_peak_rss_growth_bytes Peak memory growth while each stage ran.',
+              '# TYPE converter_span_peak_rss_growth_bytes counter']
+    lines += [f'converter_span_peak_rss_growth_bytes{{span="{name}"}} {stats[3]}' for name, stats in sorted(_spans.items())]
+    lines += ['# HELP converter_items_total Pages, paragraphs, tables and bytes processed.',
+              '# TYPE converter_items_total counter']
+    lines += [f'converter_items_total{{name="{name}"}} {value}' for name, value in sorted(_counters.items())]
+    lines += ['# HELP converter_peak_rss_bytes Peak resident memory of the process.',
+              '# TYPE converter_peak_rss_bytes gauge',
+              f'converter_peak_rss_bytes {_peak_rss()}']
+    return '\n'.join(lines) + '\n'
+
+
+def write(path=None):
+    """Write the metrics to path (default: the enable() output). JSON lines are
+    appended so runs accumulate; a .prom file is replaced as a whole."""
+    path = path or _output
+    if not path:
+        return
+    if path.endswith('.prom'):
+        part_path = path + '.part'
+        with open(part_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(part_path, path)
+    else:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json_lines())
+
+
+def _write_at_exit():
+    # Forked workers inherit the atexit hook, only the process that enabled writes
+    if _enabled and os.getpid() == _owner_pid:
+        write()
+
+
+# Worker processes get their settings from the parent instead (see batch.py)
+if os.environ.get(METRICS_ENV) and multiprocessing.parent_process() is None:
+    enable(os.environ[METRICS_ENV])
@@ -0,0 +1,86 @@
+import re
+from collections import namedtuple
+
+# A line rule: its name, the regex, what to do with a match and whether the regex
+# has to match at the start of the line (otherwise anywhere in it).
+#   action='classify': the line is labelled with the name of the first rule that matches
+#   action='strip':    every match is removed from the line
+Rule = namedtuple('Rule', ['name', 'pattern', 'action', 'anchored'], defaults=['classify', True])
+
+
+class RuleSet:
+    """A table of line rules compiled into one classifier and one stripper.
+
+    Classify rules are tried in table order within a single regex match, so the
+    first rule in the table wins when several would match. Extend a rule set with
+    ruleset.extend([...]) or RuleSet(OTHER.rules + [...]) instead of adding more
+    re calls to the converter loops.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._compile()
+
+    def _compile(self):
+        names = set()
+        classify = []
+        strip = []
+        for rule in self.rules:
+            if rule.name in names:
+                raise ValueError(f"Duplicate rule name: {rule.name}")
+            names.add(rule.name)
+            if rule.action == 'classify':
+                # Zero width lookaheads, so every alternative is tried from the start of
+                # the line and unanchored rules can still look anywhere in it
+                prefix = '' if rule.anchored else '.*?'
+                classify.append(f'(?P<{rule.name}>(?={prefix}(?:{rule.pattern})))')
+            elif rule.action == 'strip':
+                strip.append(f'(?:{rule.pattern})')
+            else:
+                raise ValueError(f"Unknown action {rule.action!r} for rule {rule.name}")
+
+        self._classifier = re.compile('|'.join(classify)) if classify else None
+        self._stripper = re.compile('|'.join(strip)) if strip else None
+
+    def extend(self, rules):
+        self.rules.extend(rules)
+        self._compile()
+
+    def classify(self, line):
+        # Name of the first matching classify rule, or None
+        if self._classifier is None:
+            return None
+        match = self._classifier.match(line)
+        return match.lastgroup if match else None
+
+    def strip(self, line):
+        # Remove everything the strip rules match
+        if self._stripper is None:
+            return line
+        return self._stripper.sub('', line)
+
+
+# Shared patterns used outside the line loops
+NUMBERED_ITEM_PATTERN = re.compile(r'^\(\d+\)')
+
+# PDF text layer lines (main5, word_markdown_html)
+PDF_RULES = RuleSet([
+    Rule('contents', r'(?i:\bCONTENTS?\b)', anchored=False),
+    Rule('numbered_clause', r'\d+\.\s'),
+])
+
+# Same classification, plus pandoc anchor leftovers removed first
+PDF_ANCHOR_RULES = RuleSet(PDF_RULES.rules + [
+    Rule('anchor', r'\[.*?\]\{#.*?\}', action='strip'),
+])
+
+# Paragraph text from python-docx (word_markdown_html), also dropping any {...}
+DOCX_RULES = RuleSet(PDF_ANCHOR_RULES.rules + [
+    Rule('braces', r'\{.*?\}', action='strip'),
+])
+
+# Tesseract output (main3)
+OCR_RULES = RuleSet([
+    Rule('heading', r'[A-Z\s]+$'),  # only capitals and spaces
+    Rule('bold', r'\b[A-Z\s]+\b', anchored=False),  # a run of capitals somewhere
+])
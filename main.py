@@ -1,9 +1,23 @@
+import argparse
 import pypandoc
 
-# Download Pandoc and install it in the venv
-pypandoc.download_pandoc()
 
-# Convert DOCX to HTML
-output = pypandoc.convert_file('example.docx', 'html', outputfile='example.html')
+def convert_with_pypandoc(input_file, output_file, download=True):
+    # Download Pandoc and install it in the venv
+    if download:
+        pypandoc.download_pandoc()
 
-print(output)
+    # Convert DOCX to HTML
+    return pypandoc.convert_file(input_file, 'html', outputfile=output_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a .docx to HTML with pypandoc')
+    parser.add_argument('input_file', nargs='?', default='example.docx')
+    parser.add_argument('output_file', nargs='?', default='example.html')
+    parser.add_argument('--no-download', action='store_true', help='use the pandoc already installed')
+    args = parser.parse_args()
+
+    output = convert_with_pypandoc(args.input_file, args.output_file, download=not args.no_download)
+
+    print(output)
@@ -1,78 +1,141 @@
+import argparse
+import functools
 import os
 import re
 from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from docx.table import Table
 from docx.text.paragraph import Paragraph
-from jinja2 import Template
+from batch import output_path_for, run_batch
+from cache import ConversionCache
+from fragments import DEFAULT_INDEX_PATH, FragmentIndex, shared_index
+from html_writer import stream_template
+from templates import DEFAULT_THEME, THEMES, get_template, template_key
+from assets import ASSET_FOLDER, AssetStore
+from docx_styles import DocumentIndex, close_lists, open_list
+from docx_xml import paragraph_images
+import docx_table
+import instrumentation
 
-def read_word_file(file_path):
-    try:
+# Bump CONVERTER_VERSION whenever the generated HTML changes so cached outputs are not reused
+CONVERTER = 'main2.read_word_file'
+CONVERTER_VERSION = '6'
+
+def iter_word_file(file_path, assets=None, fragments=None):
+    # Yields the HTML fragments of the document one at a time, so they can be
+    # written out while the rest of the document is still being read. Images are
+    # only kept when an assets.AssetStore is given. With a fragments.FragmentIndex,
+    # paragraphs and tables already rendered for another document are reused.
+    with instrumentation.span('docx.open'):
         doc = Document(file_path)
-        content = []
-        is_contents_page = False
-        list_stack = []  # Stack to handle nested lists
-
-        # Iterate through all elements (paragraphs and tables) in the document
-        for element in doc.element.body:
-            if element.tag.endswith('tbl'):
-                table = Table(element, doc)
-                formatted_table = format_table(table)
-                if formatted_table.strip():  # Ensure non-empty table
-                    content.append(formatted_table)
-                    content.append('<br>')  # Add a break after each table
-            elif element.tag.endswith('p'):
+        index = document_index(doc)
+    if fragments is not None:
+        fragments.begin_document()
+    is_contents_page = False
+    list_stack = []  # Types of the lists open now, outermost first
+
+    # Iterate through all elements (paragraphs and tables) in the document
+    for element in doc.element.body:
+        if element.tag.endswith('tbl'):
+            formatted_table = reuse_fragment(fragments, element, 'table', lambda: format_table(Table(element, doc)))
+            if formatted_table.strip():  # Ensure non-empty table
+                instrumentation.count('tables')
+                if list_stack:
+                    # A table straight after a list item would otherwise land inside its <li>
+                    yield close_lists(list_stack)
+                yield formatted_table
+                yield '<br>'  # Add a break after each table
+        elif element.tag.endswith('p'):
+            instrumentation.count('paragraphs')
+            info = index.paragraph(element)
+            key = paragraph_key(fragments, element, info) if fragments is not None and not is_contents_page else None
+            html = fragments.get(key) if key else None
+            if html is not None:
+                # Only non-empty paragraphs outside the contents are stored
+                formatted_paragraph = format_paragraph(None, list_stack, info, html)
+                if formatted_paragraph.strip():
+                    yield formatted_paragraph
+            else:
                 paragraph = Paragraph(element, doc)
                 if paragraph.text.strip():
                     if "CONTENTS" in paragraph.text.upper():
                         is_contents_page = True
-                        content.append('<h1 style="text-align: center;">CONTENTS</h1>')
+                        if list_stack:
+                            yield close_lists(list_stack)
+                        yield '<h1 style="text-align: center;">CONTENTS</h1>'
                     elif is_contents_page:
                         formatted_paragraph = format_contents_paragraph(paragraph)
                         if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                            content.append(formatted_paragraph)
+                            yield formatted_paragraph
                     else:
-                        formatted_paragraph = format_paragraph(paragraph, list_stack)
+                        html = paragraph_html(paragraph, info)
+                        if key:
+                            fragments.put(key, 'paragraph', html)
+                        formatted_paragraph = format_paragraph(paragraph, list_stack, info, html)
                         if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                            content.append(formatted_paragraph)
-        
-        # Close any remaining open lists
-        while list_stack:
-            list_type = list_stack.pop()
-            content.append(f'</{list_type}>')
-
-        return content
+                            yield formatted_paragraph
+            if assets is not None:
+                images = image_tags(element, doc.part, assets)
+                if images:
+                    yield f'<p>{images}</p>'
+
+    # Close any remaining open lists
+    if list_stack:
+        yield close_lists(list_stack)
+    if fragments is not None:
+        fragments.end_document(os.path.abspath(file_path))
+
+def document_index(doc):
+    # Heading and list lookups for a python-docx Document, see docx_styles
+    try:
+        numbering = doc.part.part_related_by(RT.NUMBERING).element
+    except KeyError:
+        numbering = None
+    return DocumentIndex(doc.styles.element, numbering)
+
+def image_tags(p, part, assets):
+    # <img> tags for the pictures in a paragraph, stored through the AssetStore
+    tags = []
+    for rel_id, display in paragraph_images(p):
+        try:
+            data = part.related_parts[rel_id].blob
+        except KeyError:
+            continue
+        tags.append(assets.img_tag(data, display))
+    return ''.join(tags)
+
+def cache_template(output_folder, images=True, theme=DEFAULT_THEME):
+    # The template part of the cache key. Pages with images point into the asset
+    # folder of their output folder, so that is part of the key as well.
+    if not images:
+        return template_key(theme)
+    return template_key(theme) + '\0' + os.path.abspath(os.path.join(output_folder, ASSET_FOLDER))
+
+def read_word_file(file_path):
+    try:
+        return list(iter_word_file(file_path))
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
 
 def format_table(table):
-    table_html = '<table style="border-collapse: collapse; border: 1px solid black; background-color: lightgray; width:100%;">'
-    merged_cells = set()
-
-    for row in table.rows:
-        table_html += '<tr>'
-        for cell in row.cells:
-            cell_text = cell.text.strip()
-            span = 1
-
-            if cell._element.grid_span is not None:
-                span = int(cell._element.grid_span)
-                cell_html = f'<td colspan="{span}" style="border: 1px solid black; padding: 5px;">{cell_text}</td>'
-            else:
-                cell_html = f'<td style="border: 1px solid black; padding: 5px;">{cell_text}</td>'
-
-            # Ensure we do not duplicate merged cells
-            if cell_text not in merged_cells or span == 1:
-                table_html += cell_html
-                if span > 1:
-                    merged_cells.add(cell_text)
+    # gridSpan/vMerge are resolved straight from the w:tbl XML, see docx_table
+    return docx_table.format_table(table._tbl)
 
-        table_html += '</tr>'
+def format_paragraph(paragraph, list_stack, info, html=None):
+    # info is the paragraph's docx_styles.ParagraphInfo, list_stack the types of
+    # the lists open before it (updated in place). html is paragraph_html() when
+    # it is already known, e.g. from the fragment index.
+    if html is None:
+        html = paragraph_html(paragraph, info)
 
-    table_html += '</table>'
-    return table_html
+    # Handling bullets and numbering, nested by the Word list level
+    if info.list_type:
+        return open_list(list_stack, info.list_type, info.depth) + html
+    return close_lists(list_stack) + html
 
-def format_paragraph(paragraph, list_stack):
+def paragraph_html(paragraph, info):
+    # The paragraph's own HTML, without opening or closing the lists around it
     formatted_text = ''
     all_bold = all(run.bold for run in paragraph.runs if run.text.strip())  # Check if all runs are bold
 
@@ -86,44 +149,40 @@ def format_paragraph(paragraph, list_stack):
             text = f'<u>{text}</u>'
         formatted_text += text
 
-    # Handling bullets and numbering
-    if paragraph.style.name.startswith('List Bullet'):
-        list_type = 'ul'
-    elif paragraph.style.name.startswith('List Number'):
-        list_type = 'ol'
-    else:
-        list_type = None
-
-    if list_type:
-        if not list_stack or list_stack[-1] != list_type:
-            if list_stack:
-                closing_list_type = list_stack.pop()
-                formatted_text = f'</{closing_list_type}>{formatted_text}'
-            list_stack.append(list_type)
-            formatted_text = f'<{list_type}><li>{formatted_text}</li>'
-        else:
-            formatted_text = f'<li>{formatted_text}</li>'
-    else:
-        if list_stack:
-            closing_list_type = list_stack.pop()
-            formatted_text = f'</{closing_list_type}>{formatted_text}'
+    if info.list_type:
+        return formatted_text
 
     # Ensure the numbering format (e.g., "(1)", "(2)") is preserved
     numbered_list_match = re.match(r'^\(\d+\)', paragraph.text.strip())
     if numbered_list_match:
         formatted_text = f'<p>{numbered_list_match.group(0)} {formatted_text[len(numbered_list_match.group(0)):].strip()}</p>'
-    else:
-        # Debugging: Print the style name of each paragraph
-        # print(f"Paragraph text: '{paragraph.text}' | Style: '{paragraph.style.name}'")
-
-        if (paragraph.style.name.startswith('Heading') or all_bold) and formatted_text.strip():
-            # Center align all headings and use <h1> tag
-            formatted_text = f'<h1 style="text-align: center;">{formatted_text}</h1>'
-        elif formatted_text.strip():
-            formatted_text = f'<p>{formatted_text}</p>'
+    elif (info.heading_level or all_bold) and formatted_text.strip():
+        # Center align all headings and use <h1> tag
+        formatted_text = f'<h1 style="text-align: center;">{formatted_text}</h1>'
+    elif formatted_text.strip():
+        formatted_text = f'<p>{formatted_text}</p>'
 
     return formatted_text
 
+def paragraph_key(fragments, element, info):
+    # Fingerprint of a w:p for the fragment index, the style decides heading/list
+    return fragments.fingerprint(element, info.heading_level, bool(info.list_type))
+
+def fragment_index(path=DEFAULT_INDEX_PATH):
+    # This process's fragment index; docx_stream writes the same HTML so it shares it
+    return shared_index(path, f'{CONVERTER}:{CONVERTER_VERSION}')
+
+def reuse_fragment(fragments, element, kind, render):
+    # render() unless the fragment index already has the HTML of an identical element
+    if fragments is None:
+        return render()
+    key = fragments.fingerprint(element)
+    html = fragments.get(key)
+    if html is None:
+        html = render()
+        fragments.put(key, kind, html)
+    return html
+
 def format_contents_paragraph(paragraph):
     text = paragraph.text.strip()
     if not text:
@@ -136,49 +195,109 @@ def format_contents_paragraph(paragraph):
     formatted_text = f'<p>{text}</p>'
     return formatted_text
 
-def create_jinja2_template(content, template_path, filename):
+def create_jinja2_template(content, template_path, filename, theme=DEFAULT_THEME):
+    # content can be a list or a generator of fragments, they are written as they come.
+    # Returns True if the file was written.
     try:
-        template_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>{{filename}}</title>
-        </head>
-        <body>
-            {% for element in content %}
-                {{ element|safe }}
-            {% endfor %}
-        </body>
-        </html>
-        """
-        template = Template(template_content)
-        rendered_content = template.render(content=content, filename=filename)
-
-        with open(template_path, 'w') as f:
-            f.write(rendered_content)
-
-        print(f"Jinja2 template created successfully at {template_path}")
+        template = get_template(theme)
+        if stream_template(template, template_path, content, filename=filename):
+            print(f"Jinja2 template created successfully at {template_path}")
+            return True
     except Exception as e:
         print(f"An error occurred: {e}")
+    return False
 
-def process_files(input_folder, output_folder):
+def process_files(input_folder, output_folder, use_cache=True, images=True, theme=DEFAULT_THEME,
+                  reuse_fragments=False):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    cache = ConversionCache() if use_cache else None
+    assets = AssetStore(os.path.join(output_folder, ASSET_FOLDER)) if images else None
+    fragments = fragment_index() if reuse_fragments else None
 
     for filename in os.listdir(input_folder):
         if filename.endswith('.docx'):
             print(filename)
             file_path = os.path.join(input_folder, filename)
-            content = read_word_file(file_path)
-            
-            if content:
-                output_file_name = f"{os.path.splitext(filename)[0]}.html"
-                template_path = os.path.join(output_folder, output_file_name)
-                create_jinja2_template(content, template_path, filename)
+            output_file_name = f"{os.path.splitext(filename)[0]}.html"
+            template_path = os.path.join(output_folder, output_file_name)
+
+            # Unchanged input, converter and template: reuse the stored HTML
+            if cache:
+                key = cache.key(file_path, CONVERTER, CONVERTER_VERSION, cache_template(output_folder, images, theme))
+                if cache.fetch(key, template_path):
+                    continue
+
+            instrumentation.count('documents')
+            if create_jinja2_template(iter_word_file(file_path, assets, fragments), template_path, filename, theme):
+                if cache:
+                    cache.put(key, template_path)
             else:
                 print(f"Failed to read the file: {filename}")
 
-input_folder = 'files'
-output_folder = 'output-word'
+    if assets is not None:
+        assets.close()
+        print(assets.report())
+    if fragments is not None:
+        print(fragments.report())
+    if cache:
+        print(cache.report())
+
+def convert_file(file_path, output_folder, images=True, theme=DEFAULT_THEME, reuse_fragments=False):
+    # Convert a single .docx and return the path of the HTML file written.
+    # Raises instead of printing so batch runs can record the failure.
+    filename = os.path.basename(file_path)
+    template_path = output_path_for(file_path, output_folder)
+    template = get_template(theme)
+    instrumentation.count('documents')
+    # Batch runs are already one process per core, so images are encoded right here;
+    # images another worker already stored are not encoded again
+    assets = AssetStore(os.path.join(output_folder, ASSET_FOLDER), workers=0) if images else None
+    fragments = fragment_index() if reuse_fragments else None
+    if not stream_template(template, template_path, iter_word_file(file_path, assets, fragments), filename=filename):
+        raise ValueError(f"Failed to read the file: {filename}")
+    return template_path
+
+def process_files_parallel(input_folder, output_folder, workers=None, manifest_path=None, use_cache=True,
+                           images=True, theme=DEFAULT_THEME, reuse_fragments=False):
+    # Same as process_files but spreads the files over a pool of worker processes
+    cache = ConversionCache() if use_cache else None
+    records = run_batch(functools.partial(convert_file, images=images, theme=theme, reuse_fragments=reuse_fragments),
+                        input_folder, output_folder, '.docx', workers=workers, manifest_path=manifest_path,
+                        cache=cache, identity=(CONVERTER, CONVERTER_VERSION, cache_template(output_folder, images, theme)))
+    if reuse_fragments:
+        # The workers kept their own hit counts, this only has the totals
+        index = FragmentIndex()
+        print(index.report())
+        index.close()
+    return records
 
-process_files(input_folder, output_folder)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert .docx files to HTML')
+    parser.add_argument('input_folder', nargs='?', default='files')
+    parser.add_argument('output_folder', nargs='?', default='output-word')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (defaults to the number of cores)')
+    parser.add_argument('--manifest', default=None,
+                        help='write a .json or .csv manifest of the run to this path')
+    parser.add_argument('--serial', action='store_true', help='convert one file at a time in this process')
+    parser.add_argument('--no-cache', action='store_true', help='reconvert every file, ignoring the cache')
+    parser.add_argument('--no-images', action='store_true', help='leave the images out of the HTML')
+    parser.add_argument('--theme', choices=THEMES, default=DEFAULT_THEME, help='page template in templates/')
+    parser.add_argument('--reuse-fragments', action='store_true',
+                        help='reuse the HTML of paragraphs and tables already converted in another document '
+                             '(index in .conversion-cache/fragments.sqlite, see fragments.py for the report)')
+    parser.add_argument('--metrics', help='write stage timings and counters here (.prom for Prometheus, else JSON lines)')
+    args = parser.parse_args()
+
+    if args.metrics:
+        instrumentation.enable(args.metrics)
+
+    if args.serial:
+        process_files(args.input_folder, args.output_folder, use_cache=not args.no_cache,
+                      images=not args.no_images, theme=args.theme, reuse_fragments=args.reuse_fragments)
+    else:
+        process_files_parallel(args.input_folder, args.output_folder,
+                               workers=args.workers, manifest_path=args.manifest,
+                               use_cache=not args.no_cache, images=not args.no_images, theme=args.theme,
+                               reuse_fragments=args.reuse_fragments)
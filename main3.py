@@ -1,46 +1,225 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pytesseract
-from PIL import Image
-import re
+from PIL import Image, ImageOps
+from line_rules import OCR_RULES
+from batch import output_path_for
+from cache import ConversionCache
+import instrumentation
 
-# Path to the image file
-image_path = 'test_pic.webp'
+# Bump CONVERTER_VERSION whenever the generated HTML changes so cached outputs are not reused
+CONVERTER = 'main3.ocr_files'
+CONVERTER_VERSION = '1'
 
-# Use pytesseract to extract text from the image
-extracted_text = pytesseract.image_to_string(Image.open(image_path))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.webp', '.gif', '.bmp')
+
+# Preprocessing and tesseract settings, all of them are part of the cache key
+OCR_OPTIONS = {
+    'grayscale': True,
+    'threshold': None,  # 0-255, pixels above it turn white and the rest black; None keeps the grays
+    'dpi': 300,  # scans that record their DPI are rescaled to this; None leaves the size alone
+    'lang': 'eng',
+    'config': '',  # extra tesseract arguments, e.g. '--psm 6'
+}
+
+# Recorded DPIs outside this range are placeholders (TIFFs without a resolution
+# report 1) and are ignored instead of blowing the image up
+SOURCE_DPI_RANGE = (50, 1200)
 
 # Function to analyze text and apply HTML formatting
 def format_to_html(text):
-    # Regular expression pattern to identify headings and bold text
-    heading_pattern = r'^[A-Z\s]+(?:\n[A-Z\s]+)*$'  # Matches lines with only uppercase letters and spaces
-    bold_pattern = r'\b[A-Z\s]+\b'  # Matches words in all caps
-
-    html_content = '<html><body>'
+    # Headings (only uppercase letters and spaces) and bold text (words in all caps)
+    # come from the OCR rule table, one regex match per line
+    parts = ['<html><body>']
     in_heading = False
 
     for line in text.split('\n'):
+        kind = OCR_RULES.classify(line)
         # Check if the line is a heading
-        if re.match(heading_pattern, line):
+        if kind == 'heading':
             if in_heading:
-                html_content += '</h1>'
-            html_content += f'<h1><strong>{line}</strong>'
+                parts.append('</h1>')
+            parts.append(f'<h1><strong>{line}</strong>')
             in_heading = True
         # Check if the line contains bold text
-        elif re.search(bold_pattern, line):
-            html_content += f'<p><strong>{line}</strong></p>'
+        elif kind == 'bold':
+            parts.append(f'<p><strong>{line}</strong></p>')
         else:
-            html_content += f'<p>{line}</p>'
+            parts.append(f'<p>{line}</p>')
 
     if in_heading:
-        html_content += '</h1>'
+        parts.append('</h1>')
+
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+def preprocess(image, grayscale=True, threshold=None, dpi=None):
+    # Grayscale, rescale to the target DPI when the scan records its own, then binarize
+    if grayscale or threshold is not None:
+        image = ImageOps.grayscale(image)
+
+    source_dpi = (image.info.get('dpi') or (0, 0))[0]
+    if dpi and SOURCE_DPI_RANGE[0] <= source_dpi <= SOURCE_DPI_RANGE[1] and abs(source_dpi - dpi) > 1:
+        scale = dpi / source_dpi
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    if threshold is not None:
+        if not 0 <= threshold <= 255:
+            raise ValueError(f"threshold must be between 0 and 255, got {threshold}")
+        # Lookup table instead of a per-pixel python function
+        image = image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+    return image
+
+def iter_image_files(inputs):
+    # Files as given, directories expanded to the images inside them
+    for path in inputs:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(path, filename)
+        else:
+            yield path
+
+def count_frames(image_path):
+    # Multi-page TIFFs and animated GIF/WebP have several frames, everything else one
+    with Image.open(image_path) as image:
+        return getattr(image, 'n_frames', 1)
+
+def ocr_frame(image_path, frame, options):
+    # Runs in a worker process: preprocess one frame of an image and OCR it
+    with Image.open(image_path) as image:
+        image.seek(frame)
+        image.load()
+        prepared = preprocess(image, options['grayscale'], options['threshold'], options['dpi'])
+        return pytesseract.image_to_string(prepared, lang=options['lang'], config=options['config'])
+
+def _ocr_job(job):
+    # Errors are caught here so one bad frame never takes the whole batch down
+    image_path, frame, options = job
+    try:
+        return ocr_frame(image_path, frame, options), None
+    except Exception as e:
+        return None, str(e)
+
+def ocr_files(inputs, output_folder, workers=None, use_cache=True, **options):
+    """OCR every image (directories, multi-page TIFFs and animated images included)
+    into one HTML file per input in output_folder.
+
+    Frames of all the inputs are spread over a pool of worker processes, so a long
+    TIFF uses every core. Inputs whose bytes and options are unchanged are copied
+    from the conversion cache. Returns the paths of the files written.
+    """
+    options = {**OCR_OPTIONS, **options}
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    cache = ConversionCache() if use_cache else None
+    options_key = repr(sorted(options.items()))
+
+    # Outputs are named after the input without its extension, so scan.png and
+    # scan.tif (or two scan.png in different folders) would overwrite each other
+    image_paths = list(iter_image_files(inputs))
+    outputs = {}
+    for image_path in image_paths:
+        outputs.setdefault(output_path_for(image_path, output_folder), []).append(image_path)
+    for output_path, clashing in outputs.items():
+        if len(clashing) > 1:
+            print(f"Skipping {', '.join(clashing)}: they would all be written to {output_path}")
+
+    todo = []  # (image_path, output_path, cache key, frame count)
+    written = []
+    for image_path in image_paths:
+        output_path = output_path_for(image_path, output_folder)
+        if len(outputs[output_path]) > 1:
+            continue
+        key = None
+        if cache:
+            key = cache.key(image_path, CONVERTER, CONVERTER_VERSION, options_key)
+            if cache.fetch(key, output_path):
+                written.append(output_path)
+                continue
+        try:
+            todo.append((image_path, output_path, key, count_frames(image_path)))
+        except Exception as e:
+            print(f"Failed to read the file: {image_path}: {e}")
+
+    jobs = [(image_path, frame, options) for image_path, _, _, frames in todo for frame in range(frames)]
+    if workers == 1:
+        results = map(_ocr_job, jobs)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, min(8, len(jobs) // ((workers or os.cpu_count() or 1) * 4)))
+        results = executor.map(_ocr_job, jobs, chunksize=chunksize)
+
+    try:
+        # Results come back in job order, so the frames of each file arrive together
+        for image_path, output_path, key, frames in todo:
+            texts = []
+            errors = []
+            for _ in range(frames):
+                text, error = next(results)
+                texts.append(text)
+                if error:
+                    errors.append(error)
+            instrumentation.count('images')
+            instrumentation.count('ocr_pages', frames)
+            if errors:
+                print(f"Failed to OCR {image_path}: {errors[0]}")
+                continue
+
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(format_to_html('\n'.join(texts)))
+            if cache:
+                cache.put(key, output_path)
+            written.append(output_path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if cache:
+        print(cache.report())
+    return written
+
+def convert_file(image_path, output_path, **options):
+    # OCR one image (every frame of it) to output_path in this process, no cache
+    options = {**OCR_OPTIONS, **options}
+    texts = [ocr_frame(image_path, frame, options) for frame in range(count_frames(image_path))]
+    instrumentation.count('images')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(format_to_html('\n'.join(texts)))
+    return output_path
 
-    html_content += '</body></html>'
-    return html_content
+def gray_level(value):
+    # argparse type for --threshold, image.point() needs a level inside the 256 entry table
+    level = int(value)
+    if not 0 <= level <= 255:
+        raise argparse.ArgumentTypeError(f"{value} is not between 0 and 255")
+    return level
 
-# Convert the extracted text to HTML format with advanced formatting
-html_content = format_to_html(extracted_text)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OCR images to HTML')
+    parser.add_argument('inputs', nargs='*', default=['test_pic.webp'],
+                        help='image files or directories of images (default: test_pic.webp)')
+    parser.add_argument('-o', '--output-folder', default='output-ocr')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (defaults to the number of cores)')
+    parser.add_argument('--no-grayscale', action='store_true', help='OCR the images in colour')
+    parser.add_argument('--threshold', type=gray_level, default=None,
+                        help='binarize at this gray level (0-255) before OCR')
+    parser.add_argument('--dpi', type=int, default=OCR_OPTIONS['dpi'],
+                        help='rescale scans to this DPI when they record their own (0 to keep the size)')
+    parser.add_argument('--lang', default=OCR_OPTIONS['lang'], help='tesseract language(s), e.g. eng+fra')
+    parser.add_argument('--config', default=OCR_OPTIONS['config'], help="extra tesseract arguments, e.g. '--psm 6'")
+    parser.add_argument('--no-cache', action='store_true', help='OCR every image again, ignoring the cache')
+    parser.add_argument('--metrics', help='write stage timings and counters here (.prom for Prometheus, else JSON lines)')
+    args = parser.parse_args()
 
-# Save the HTML content to a file
-with open('output.html', 'w') as f:
-    f.write(html_content)
+    if args.metrics:
+        instrumentation.enable(args.metrics)
 
-print("HTML content saved to output.html")
+    for output_path in ocr_files(args.inputs, args.output_folder, workers=args.workers,
+                                 use_cache=not args.no_cache, grayscale=not args.no_grayscale,
+                                 threshold=args.threshold, dpi=args.dpi or None,
+                                 lang=args.lang, config=args.config):
+        print(f"HTML content saved to {output_path}")
@@ -1,17 +1,244 @@
+import argparse
+import os
+from html import escape
 import pandas as pd
 
-def convert_csv_to_html(file_path):
-    df = pd.read_csv(file_path)
-    html_content = df.to_html(index=False)
+# Rows read from the input at a time, memory stays flat whatever the file size
+# (Excel files cannot be read in chunks and are loaded whole)
+CHUNK_ROWS = 50000
 
-    return html_content
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls', '.parquet')
 
-csv_file_path = 'price_list.csv'
+# Schema types that are parsed as dates instead of being passed to pandas as a dtype
+DATE_TYPES = ('date', 'datetime')
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-html_content = convert_csv_to_html(csv_file_path)
+TABLE_START = '<table border="1" class="dataframe">\n'
+TABLE_END = '  </tbody>\n</table>'
 
-output_file_path = 'price_list.html'
-with open(output_file_path, 'w') as f:
-    f.write(html_content)
+PAGE_START = '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n</head>\n<body>\n'
+PAGE_END = '\n</body>\n</html>\n'
 
-print(f"HTML content saved to {output_file_path}")
+def _split_schema(dtype):
+    # {'price': 'float', 'updated': 'date'} -> pandas dtypes and date columns
+    dtype = dtype or {}
+    dates = [column for column, kind in dtype.items() if kind in DATE_TYPES]
+    types = {column: kind for column, kind in dtype.items() if kind not in DATE_TYPES}
+    return types, dates
+
+def _apply_schema(df, types, dates):
+    if types:
+        df = df.astype(types)
+    for column in dates:
+        # Each value parsed on its own, so '2024-01-03' and '2024-01-04 10:30' can share a column
+        df[column] = pd.to_datetime(df[column], format='mixed')
+    return df
+
+def read_table(file_path, chunk_rows=CHUNK_ROWS, dtype=None, usecols=None):
+    """Returns (columns, iterator of DataFrame chunks) for a .csv, .xlsx/.xls or .parquet file.
+
+    dtype maps column names to pandas dtypes ('int64', 'float', 'str'...) or
+    'date'/'datetime', usecols limits the columns read. CSV columns without a
+    dtype are read as text exactly as they appear in the file, so no type
+    inference runs at all; Excel and Parquet cells already carry their types.
+    Reading .xlsx needs openpyxl and .parquet needs pyarrow.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    types, dates = _split_schema(dtype)
+
+    if extension == '.csv':
+        columns = pd.read_csv(file_path, nrows=0, usecols=usecols).columns
+        csv_types = {column: types.get(column, str) for column in columns}
+        chunks = pd.read_csv(file_path, chunksize=chunk_rows, usecols=usecols, dtype=csv_types,
+                             keep_default_na=False, na_values=[''])
+        # Dates are parsed per chunk instead of with parse_dates, which leaves a
+        # chunk as text when its values don't all share the first one's format
+        return columns, (_apply_schema(chunk, {}, dates) for chunk in chunks) if dates else chunks
+
+    if extension in ('.xlsx', '.xls'):
+        df = _apply_schema(pd.read_excel(file_path, usecols=usecols), types, dates)
+        return df.columns, (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(file_path)
+        columns = pd.Index(usecols or parquet.schema_arrow.names)
+        batches = parquet.iter_batches(batch_size=chunk_rows, columns=usecols)
+        return columns, (_apply_schema(batch.to_pandas(), types, dates) for batch in batches)
+
+    raise ValueError(f"Unsupported file type {extension or file_path}, expected one of {SUPPORTED_EXTENSIONS}")
+
+def date_formats(dtype):
+    # Column -> strftime format of the columns given as 'date'/'datetime' in the schema
+    return {column: DATE_FORMAT if kind == 'date' else DATETIME_FORMAT
+            for column, kind in (dtype or {}).items() if kind in DATE_TYPES}
+
+def date_format(column):
+    # Dates without a time when every value present is at midnight
+    dates = column.dt
+    midnight = (dates.hour == 0) & (dates.minute == 0) & (dates.second == 0) & (dates.microsecond == 0)
+    return DATE_FORMAT if midnight[column.notna()].all() else DATETIME_FORMAT
+
+def format_column(column, dates_as=None):
+    # A whole column to escaped cell text in one go, formatted by its dtype.
+    # dates_as is the strftime format for a date column, by default from its values
+    missing = column.isna()
+    kind = column.dtype.kind
+    if kind == 'M':
+        values = column.dt.strftime(dates_as or date_format(column))
+    else:
+        values = column.astype(str)
+        if kind not in 'biuf':
+            # Only text can contain markup
+            values = values.map(escape)
+    if missing.any():
+        values = values.mask(missing, '')
+    return values.to_numpy()
+
+def header_html(columns):
+    # Same layout as DataFrame.to_html(index=False)
+    cells = ''.join(f'      <th>{escape(str(column))}</th>\n' for column in columns)
+    return f'  <thead>\n    <tr style="text-align: right;">\n{cells}    </tr>\n  </thead>\n  <tbody>\n'
+
+def rows_html(chunk, formats=None):
+    # The <tr> of every row in the chunk. Cells are formatted a column at a
+    # time, then each row is a single join. formats (column -> date format) is
+    # filled in from the first chunk a date column is seen in and kept for the
+    # later chunks, so a column never switches between dates and datetimes.
+    formats = {} if formats is None else formats
+    cells = []
+    for column in chunk.columns:
+        values = chunk[column]
+        if values.dtype.kind == 'M' and column not in formats:
+            formats[column] = date_format(values)
+        cells.append(format_column(values, formats.get(column)))
+    if not cells:
+        return ['    <tr>\n    </tr>\n'] * len(chunk)
+    separator = '</td>\n      <td>'
+    return [f'    <tr>\n      <td>{separator.join(row)}</td>\n    </tr>\n' for row in zip(*cells)]
+
+def iter_table_html(file_path, chunk_rows=CHUNK_ROWS, dtype=None, usecols=None):
+    # Yields the table piece by piece: header once, then the rows chunk by chunk
+    columns, chunks = read_table(file_path, chunk_rows, dtype, usecols)
+    yield TABLE_START
+    yield header_html(columns)
+    formats = date_formats(dtype)
+    for chunk in chunks:
+        yield ''.join(rows_html(chunk, formats))
+    yield TABLE_END
+
+def convert_csv_to_html(file_path, chunk_rows=CHUNK_ROWS, dtype=None, usecols=None):
+    # The whole table as one string (any of SUPPORTED_EXTENSIONS), use
+    # write_table_html for big files
+    return ''.join(iter_table_html(file_path, chunk_rows, dtype, usecols))
+
+def write_table_html(file_path, output_path, chunk_rows=CHUNK_ROWS, dtype=None, usecols=None):
+    # Streams the table to output_path, written to a .part file first so a
+    # failed run never leaves half a table behind
+    part_path = output_path + '.part'
+    try:
+        with open(part_path, 'w', encoding='utf-8') as f:
+            f.writelines(iter_table_html(file_path, chunk_rows, dtype, usecols))
+    except BaseException:
+        # open() itself may have failed, and the original error is the one to report
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, output_path)
+    return output_path
+
+def _page_name(name, number):
+    return f"{name}-{number:04d}.html"
+
+def write_paginated_html(file_path, output_folder, page_rows, chunk_rows=CHUNK_ROWS, dtype=None, usecols=None):
+    """Split the table into pages of page_rows rows, each with the header and
+    previous/index/next links, plus an index page <name>.html listing the row
+    range of every page. Returns the path of the index page."""
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    columns, chunks = read_table(file_path, chunk_rows, dtype, usecols)
+    header = TABLE_START + header_html(columns)
+
+    pages = []  # (file name, first row, last row)
+    out = None
+    try:
+        row_number = 0
+        formats = date_formats(dtype)
+        for chunk in chunks:
+            for row in rows_html(chunk, formats):
+                if row_number % page_rows == 0:
+                    number = len(pages) + 1
+                    if out is not None:
+                        # The next page exists now, so the previous one can link to it
+                        _close_page(out, name, number - 1, next_page=_page_name(name, number))
+                    out = open(os.path.join(output_folder, _page_name(name, number)), 'w', encoding='utf-8')
+                    pages.append([_page_name(name, number), row_number + 1, row_number + 1])
+                    out.write(PAGE_START.format(title=escape(f"{name} page {number}")))
+                    out.write(_nav(name, number))
+                    out.write(header)
+                out.write(row)
+                row_number += 1
+                pages[-1][2] = row_number
+        if out is not None:
+            _close_page(out, name, len(pages))
+            out = None
+    finally:
+        if out is not None:
+            out.close()
+
+    # Pages left over from an earlier run of a longer table
+    number = len(pages) + 1
+    while os.path.exists(os.path.join(output_folder, _page_name(name, number))):
+        os.remove(os.path.join(output_folder, _page_name(name, number)))
+        number += 1
+
+    index_path = os.path.join(output_folder, f"{name}.html")
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(PAGE_START.format(title=escape(name)))
+        f.write(f'<h1>{escape(name)}</h1>\n<table border="1">\n  <tr><th>Page</th><th>Rows</th></tr>\n')
+        for number, (page_file, first, last) in enumerate(pages, 1):
+            f.write(f'  <tr><td><a href="{page_file}">{number}</a></td><td>{first}-{last}</td></tr>\n')
+        f.write('</table>')
+        f.write(PAGE_END)
+    return index_path
+
+def _nav(name, number, next_page=None):
+    links = [f'<a href="{name}.html">Index</a>']
+    if number > 1:
+        links.insert(0, f'<a href="{_page_name(name, number - 1)}">Previous</a>')
+    if next_page:
+        links.append(f'<a href="{next_page}">Next</a>')
+    return '<p>' + ' | '.join(links) + '</p>\n'
+
+def _close_page(out, name, number, next_page=None):
+    out.write(TABLE_END)
+    out.write('\n' + _nav(name, number, next_page))
+    out.write(PAGE_END)
+    out.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a CSV, Excel or Parquet file to an HTML table')
+    parser.add_argument('input_file', nargs='?', default='price_list.csv')
+    parser.add_argument('output', nargs='?', default=None,
+                        help='output file (default: <input>.html), or the folder for --page-rows')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows read from the input at a time')
+    parser.add_argument('--page-rows', type=int, default=None,
+                        help='split the table into pages of this many rows plus an index page')
+    parser.add_argument('--dtype', action='append', default=[], metavar='COLUMN=TYPE',
+                        help="column type, e.g. price=float or updated=date, can be repeated")
+    parser.add_argument('--usecols', default=None, help='comma separated columns to keep')
+    args = parser.parse_args()
+
+    dtype = dict(item.split('=', 1) for item in args.dtype)
+    usecols = args.usecols.split(',') if args.usecols else None
+    if args.page_rows:
+        output_path = write_paginated_html(args.input_file, args.output or 'output-csv', args.page_rows,
+                                           args.chunk_rows, dtype, usecols)
+    else:
+        output_path = write_table_html(args.input_file, args.output or f"{os.path.splitext(args.input_file)[0]}.html",
+                                       args.chunk_rows, dtype, usecols)
+
+    print(f"HTML content saved to {output_path}")
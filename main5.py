@@ -1,67 +1,159 @@
+import argparse
 import fitz  # PyMuPDF
+import html
 import re
-from jinja2 import Template
+from collections import namedtuple
+from line_rules import NUMBERED_ITEM_PATTERN, PDF_RULES
 import os
+from assets import ASSET_FOLDER, AssetStore
+from cache import ConversionCache
+from html_writer import stream_template
+from pdf_pages import (SECTION_OVERRUN, SectionBreak, iter_text_layer, ocr_available, ocr_scanned_pages,
+                       page_image_tags)
+from templates import THEMES, get_template, template_key
+import instrumentation
 
-def read_pdf_file(file_path):
+# Bump CONVERTER_VERSION whenever the generated HTML changes so cached outputs are not reused
+CONVERTER = 'main5.read_pdf_file'
+CONVERTER_VERSION = '4'
+LAYOUT_VERSION = '3'  # Bump when pdf_layout's output changes
+
+# Page template in templates/
+DEFAULT_THEME = 'legal-print'
+
+# Sectioned output: the section pages of a document go in a folder named after it,
+# next to an index page that links to them
+SECTION_FILE = 'section-{:04d}.html'
+
+def iter_page_lines(file_path, workers=1, ocr=True):
+    # Yields the lines of every page in order, with scanned pages OCR'd when ocr is on
+    return (lines for lines, _ in _iter_pages(file_path, workers, ocr))
+
+def _iter_pages(file_path, workers=1, ocr=True):
+    # (lines, whether the page was OCR'd) of every page in order
+    pages = iter_text_layer(file_path, workers, ocr)
+    return ocr_scanned_pages(file_path, pages, workers) if ocr else pages
+
+class Fragment(str):
+    # A finished piece of HTML among a page's lines, such as an image, written as is
+    pass
+
+def _with_images(file_path, pages, assets):
+    # Adds each page's images after its lines, pages being _iter_pages() pairs.
+    # Images are read here, in page order, while the text may still come from
+    # worker processes.
+    doc = fitz.open(file_path)
     try:
-        doc = fitz.open(file_path)
-        content = []
-        list_stack = []  # Stack to handle nested lists
-        is_contents_section = False
-        contents_table = []
-        paragraph_buffer = []  # Buffer to collect related paragraphs
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text("text")
-
-            print(f"Processing page {page_num + 1}")  # Debugging statement
-
-            for line in text.split('\n'):
-                line = line.strip()
-                if line:
-                    if re.search(r'\bCONTENTS?\b', line.upper()):
-                        is_contents_section = True
-                        contents_table.append("<table>")
-                        continue
-
-                    if is_contents_section:
-                        if not re.match(r'^\d+\.\s', line):
-                            is_contents_section = False
-                            contents_table.append("</table>")
-                            content.extend(contents_table)
-                            contents_table = []
-
-                    if is_contents_section:
-                        formatted_line = format_contents_line(line)
-                        contents_table.append(formatted_line)
-                    else:
-                        if re.match(r'^[0-9]+\.\s', line):
-                            # Line starts with a number followed by a period and a space
-                            line = f"<b>{line}</b>"
-                        paragraph_buffer.append(line)
+        for page_num, (lines, ocred) in enumerate(pages):
+            with instrumentation.span('pdf.images'):
+                images = page_image_tags(doc.load_page(page_num), assets, ocred)
+            yield lines + [Fragment(f'<p>{images}</p>')] if images else lines
+    finally:
+        doc.close()
+
+
 
-                elif paragraph_buffer:
-                    # End of a paragraph block
+def iter_pdf_fragments(pages, section_pages=None, split_clauses=False):
+    # Turn the lines of each page into HTML fragments, yielded as soon as they are
+    # complete. The CONTENTS table, the list stack and the paragraph buffer all
+    # carry over from one page to the next.
+    #
+    # With section_pages and/or split_clauses a SectionBreak is yielded where a new
+    # section should start: at the first paragraph once section_pages pages have
+    # gone by, at every top-level numbered clause, or with both at the first clause
+    # after section_pages pages (or the first paragraph after SECTION_OVERRUN times
+    # that, when no clause comes). Open lists are closed before each break so every
+    # section is complete HTML.
+    list_stack = []  # Stack to handle nested lists
+    is_contents_section = False
+    contents_table = []
+    paragraph_buffer = []  # Buffer to collect related paragraphs
+    splitting = bool(section_pages or split_clauses)
+    section_start = 0  # Page the current section started on
+    section_lines = 0  # Lines in the current section so far
+
+    for page_num, lines in enumerate(pages):
+        for line in lines:
+            if line:
+                section_lines += 1
+            if isinstance(line, Fragment):
+                # Ends the paragraph before it like a blank line would
+                if paragraph_buffer:
                     formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
-                    if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                        print(f"Formatted paragraph: {formatted_paragraph}")  # Debugging statement
-                        content.append(formatted_paragraph)
+                    if formatted_paragraph.strip():
+                        instrumentation.count('paragraphs')
+                        yield formatted_paragraph
                     paragraph_buffer = []
+                yield line
+            elif line:
+                # One regex match per line decides what kind of line it is
+                kind = PDF_RULES.classify(line)
+                if kind == 'contents':
+                    is_contents_section = True
+                    contents_table.append("<table>")
+                    continue
+
+                if is_contents_section:
+                    if kind != 'numbered_clause':
+                        is_contents_section = False
+                        contents_table.append("</table>")
+                        instrumentation.count('tables')
+                        yield from contents_table
+                        contents_table = []
+
+                if is_contents_section:
+                    formatted_line = format_contents_line(line)
+                    contents_table.append(formatted_line)
+                else:
+                    if (splitting and section_lines > 1 and not paragraph_buffer
+                            and (not section_pages or page_num - section_start >= section_pages)
+                            and (not split_clauses or kind == 'numbered_clause'
+                                 or section_pages and page_num - section_start >= section_pages * SECTION_OVERRUN)):
+                        while list_stack:
+                            yield f'</{list_stack.pop()}>'
+                        yield SectionBreak(page_num + 1, line if kind == 'numbered_clause' else None)
+                        section_start, section_lines = page_num, 1
+                    if kind == 'numbered_clause':
+                        # Line starts with a number followed by a period and a space
+                        line = f"<b>{line}</b>"
+                    paragraph_buffer.append(line)
+
+            elif paragraph_buffer:
+                # End of a paragraph block
+                formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
+                if formatted_paragraph.strip():  # Ensure non-empty paragraph
+                    instrumentation.count('paragraphs')
+                    yield formatted_paragraph
+                paragraph_buffer = []
 
-        # Handle any remaining paragraphs
-        if paragraph_buffer:
-            formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
-            if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                content.append(formatted_paragraph)
+    # Handle any remaining paragraphs
+    if paragraph_buffer:
+        formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
+        if formatted_paragraph.strip():  # Ensure non-empty paragraph
+            instrumentation.count('paragraphs')
+            yield formatted_paragraph
 
-        # Close any remaining open lists
-        while list_stack:
-            list_type = list_stack.pop()
-            content.append(f'</{list_type}>')
+    # Close any remaining open lists
+    while list_stack:
+        list_type = list_stack.pop()
+        yield f'</{list_type}>'
 
-        return content
+def iter_pdf_file(file_path, workers=1, ocr=True, assets=None, section_pages=None, split_clauses=False,
+                  layout=False):
+    # Images are only kept when an assets.AssetStore is given. SectionBreaks are
+    # only yielded when section_pages or split_clauses is given. layout=True
+    # classifies lines by font size, weight and position instead, see pdf_layout.
+    if layout:
+        import pdf_layout
+        return pdf_layout.iter_pdf_file(file_path, workers, ocr, assets, section_pages, split_clauses)
+    pages = _iter_pages(file_path, workers, ocr)
+    if assets is not None:
+        return iter_pdf_fragments(_with_images(file_path, pages, assets), section_pages, split_clauses)
+    return iter_pdf_fragments((lines for lines, _ in pages), section_pages, split_clauses)
+
+def read_pdf_file(file_path, workers=1, ocr=True):
+    try:
+        return list(iter_pdf_file(file_path, workers, ocr))
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
@@ -79,7 +171,8 @@ def format_paragraph(paragraphs, list_stack):
     list_type = None
 
     # Handling bullets and numbering
-    if re.match(r'^\(\d+\)', paragraphs[0]):
+    numbered_list_match = NUMBERED_ITEM_PATTERN.match(paragraphs[0])
+    if numbered_list_match:
         list_type = 'ol'
 
     if list_type:
@@ -97,69 +190,190 @@ def format_paragraph(paragraphs, list_stack):
             formatted_text = f'</{closing_list_type}>{formatted_text}'
 
     # Ensure the numbering format (e.g., "(1)", "(2)") is preserved
-    numbered_list_match = re.match(r'^\(\d+\)', paragraphs[0])
     if numbered_list_match:
         formatted_text = f'{numbered_list_match.group(0)} {formatted_text[len(numbered_list_match.group(0)):].strip()}'
 
     return formatted_text.strip()
 
-def create_jinja2_template(content, template_path, filename):
+def create_jinja2_template(content, template_path, filename, theme=DEFAULT_THEME):
+    # content can be a list or a generator of fragments, they are written as they come.
+    # Returns True if the file was written.
     try:
-        template_content = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>{{filename}}</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-        }
-        p {
-            margin: 0 0 10px;
-        }
-        b {
-            display: block;
-            margin: 10px 0;
-            font-weight: bold;
-        }
-    </style>
-</head>
-<body>
-    {% for element in content %}
-    {% if element.strip() %}
-    {{ element|safe }}
-    {% endif %}
-    {% endfor %}
-</body>
-</html>
-"""
-        template = Template(template_content)
-        rendered_content = template.render(content=content, filename=filename)
-        
-        with open(template_path, 'w') as f:
-            f.write(rendered_content)
-
-        print(f"Jinja2 template created successfully at {template_path}")
+        template = get_template(theme)
+        if stream_template(template, template_path, content, filename=filename):
+            print(f"Jinja2 template created successfully at {template_path}")
+            return True
     except Exception as e:
         print(f"An error occurred: {e}")
+    return False
+
+# Links of a section page; next is called once the section has been written
+Navigation = namedtuple('Navigation', 'index previous next')
 
-def process_files(input_folder, output_folder):
+def section_folder(output_path):
+    # The folder the section pages of output_path go in: output/filing.html -> output/filing/
+    return os.path.splitext(output_path)[0]
+
+def write_sections(fragments, output_path, template, filename):
+    """Write fragments split at their SectionBreaks into one page per section in
+    section_folder(output_path), plus an index page linking to them at
+    output_path. Each section is streamed to disk before the next one is read, so
+    only the section titles are kept for the whole document. Returns the number
+    of sections written."""
+    folder = section_folder(output_path)
+    os.makedirs(folder, exist_ok=True)
+    index = f"../{os.path.basename(output_path)}"
+    fragments = iter(fragments)
+    sections = []  # (file name, clause title or None, first page) of the sections written
+    breaks = [SectionBreak(1)]
+
+    def section_content():
+        # The fragments up to the next SectionBreak, which is left in breaks
+        for fragment in fragments:
+            if isinstance(fragment, SectionBreak):
+                breaks.append(fragment)
+                return
+            yield fragment
+
+    while breaks:
+        section = breaks.pop()
+        section_file = SECTION_FILE.format(len(sections) + 1)
+        following = SECTION_FILE.format(len(sections) + 2)
+        nav = Navigation(index, sections[-1][0] if sections else None, lambda: following if breaks else None)
+        title = section.title or f"Page {section.page}"
+        with instrumentation.span('pdf.section'):
+            if stream_template(template, os.path.join(folder, section_file), section_content(),
+                               filename=f"{filename} - {title}", nav=nav):
+                sections.append((section_file, section.title, section.page))
+
+    # Sections left over from an earlier, longer conversion
+    last = sections[-1][0] if sections else ''
+    for name in os.listdir(folder):
+        if name.startswith('section-') and name.endswith('.html') and name > last:
+            os.remove(os.path.join(folder, name))
+    if not sections:
+        return 0
+
+    folder_name = os.path.basename(folder)
+    links = [f'<h1>{html.escape(filename)}</h1>', '<ol>']
+    links += [f'<li><a href="{folder_name}/{name}">{html.escape(title)}</a> (page {page})</li>' if title else
+              f'<li><a href="{folder_name}/{name}">Page {page}</a></li>' for name, title, page in sections]
+    links.append('</ol>')
+    stream_template(template, output_path, links, filename=filename)
+    return len(sections)
+
+def convert_file(file_path, output_path, workers=1, ocr=True, images=True, theme=DEFAULT_THEME,
+                 section_pages=None, split_clauses=False, layout=False):
+    # Convert a single PDF to output_path, images go to the assets folder next to it.
+    # With section_pages or split_clauses output_path is an index page and the
+    # sections go in section_folder(output_path), see write_sections.
+    # Raises instead of printing so callers can report the failure.
+    template = get_template(theme)
+    sectioned = bool(section_pages or split_clauses)
+    assets = None
+    if images:
+        assets = AssetStore(os.path.join(os.path.dirname(os.path.abspath(output_path)), ASSET_FOLDER),
+                            html_dir=section_folder(os.path.abspath(output_path)) if sectioned else None,
+                            workers=0 if workers == 1 else workers)
+    instrumentation.count('documents')
+    try:
+        fragments = iter_pdf_file(file_path, workers, ocr, assets, section_pages, split_clauses, layout)
+        if sectioned:
+            written = write_sections(fragments, output_path, template, os.path.basename(file_path))
+        else:
+            written = stream_template(template, output_path, fragments, filename=os.path.basename(file_path))
+    finally:
+        if assets is not None:
+            assets.close()
+    if not written:
+        raise ValueError(f"Failed to read the file: {os.path.basename(file_path)}")
+    return output_path
+
+def process_files(input_folder, output_folder, use_cache=True, workers=1, ocr=True, images=True,
+                  theme=DEFAULT_THEME, section_pages=None, split_clauses=False, layout=False):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    sectioned = bool(section_pages or split_clauses)
+    # The cache holds one file per conversion, so sectioned output is always reconverted
+    cache = ConversionCache() if use_cache and not sectioned else None
+    asset_dir = os.path.join(output_folder, ASSET_FOLDER)
+    assets = AssetStore(asset_dir, workers=0 if workers == 1 else workers) if images else None
 
     for filename in os.listdir(input_folder):
         if filename.endswith('.pdf'):
             print(f"Processing file: {filename}")
             file_path = os.path.join(input_folder, filename)
-            content = read_pdf_file(file_path)
-            
-            if content:
-                output_file_name = f"{os.path.splitext(filename)[0]}.html"
-                template_path = os.path.join(output_folder, output_file_name)
-                create_jinja2_template(content, template_path, filename)
+            output_file_name = f"{os.path.splitext(filename)[0]}.html"
+            template_path = os.path.join(output_folder, output_file_name)
+
+            # Unchanged input, converter and template: reuse the stored HTML
+            if cache:
+                # Without tesseract scanned pages come out as they would with OCR off, so
+                # those results must not be served once it is installed
+                version = f"{CONVERTER_VERSION}-ocr" if ocr and ocr_available() else CONVERTER_VERSION
+                if layout:
+                    version += f"-layout{LAYOUT_VERSION}"
+                # Pages with images point into this output folder's assets
+                template = template_key(theme) + '\0' + os.path.abspath(asset_dir) if images else template_key(theme)
+                key = cache.key(file_path, CONVERTER, version, template)
+                if cache.fetch(key, template_path):
+                    continue
+
+            if sectioned:
+                instrumentation.count('documents')
+                if assets is not None:
+                    # Images are linked from the section pages, one folder further down
+                    assets.html_dir = section_folder(os.path.abspath(template_path))
+                try:
+                    fragments = iter_pdf_file(file_path, workers, ocr, assets, section_pages, split_clauses, layout)
+                    count = write_sections(fragments, template_path, get_template(theme), filename)
+                    if count:
+                        print(f"{count} sections written to {section_folder(template_path)}, index at {template_path}")
+                    else:
+                        print(f"Failed to read the file: {filename}")
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                continue
+
+            instrumentation.count('documents')
+            fragments = iter_pdf_file(file_path, workers, ocr, assets, layout=layout)
+            if create_jinja2_template(fragments, template_path, filename, theme):
+                if cache:
+                    cache.put(key, template_path)
             else:
                 print(f"Failed to read the file: {filename}")
 
-input_folder = 'files'
-output_folder = 'output-pdf'
-process_files(input_folder, output_folder)
+    if assets is not None:
+        assets.close()
+        print(assets.report())
+    if cache:
+        print(cache.report())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert .pdf files to HTML')
+    parser.add_argument('input_folder', nargs='?', default='files')
+    parser.add_argument('output_folder', nargs='?', default='output-pdf')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes extracting and OCRing the pages of each PDF (0 for one per core)')
+    parser.add_argument('--no-ocr', action='store_true', help='only use the text layer, even for scanned pages')
+    parser.add_argument('--no-cache', action='store_true', help='reconvert every file, ignoring the cache')
+    parser.add_argument('--no-images', action='store_true', help='leave the images out of the HTML')
+    parser.add_argument('--theme', choices=THEMES, default=DEFAULT_THEME, help='page template in templates/')
+    parser.add_argument('--section-pages', type=int, default=None,
+                        help='start a new section page every N pages (at the next paragraph), with an index page')
+    parser.add_argument('--split-clauses', action='store_true',
+                        help='start a new section page at each top-level numbered clause '
+                             '(with --section-pages, at the first clause after N pages)')
+    parser.add_argument('--layout', action='store_true',
+                        help='find headings, lists and running headers/footers from font sizes and positions '
+                             '(with --split-clauses, sections start at top level headings)')
+    parser.add_argument('--metrics', help='write stage timings and counters here (.prom for Prometheus, else JSON lines)')
+    args = parser.parse_args()
+
+    if args.metrics:
+        instrumentation.enable(args.metrics)
+
+    process_files(args.input_folder, args.output_folder,
+                  use_cache=not args.no_cache, workers=args.workers or None, ocr=not args.no_ocr,
+                  images=not args.no_images, theme=args.theme, section_pages=args.section_pages,
+                  split_clauses=args.split_clauses, layout=args.layout)
@@ -0,0 +1,50 @@
+-- Pandoc filter doing the work clean_md.py and clean_html.py do with regexes,
+-- but on the document tree so it can run inside the single pandoc call.
+
+-- Elements whose ids, classes and {...} attribute blocks get dropped
+local function strip_attr(el)
+  el.attr = pandoc.Attr()
+  return el
+end
+
+-- Links to Word bookmarks (_Toc anchors, \l field switches) and any other
+-- in-page link, since the ids they point at are removed
+local function is_internal(target)
+  return target:sub(1, 1) == '#' or target:sub(1, 2) == '\\l'
+end
+
+function Span(el)
+  -- []{#_Toc123 .anchor} bookmarks: keep whatever is inside, drop the span
+  if el.identifier:match('^_Toc') or el.classes:includes('anchor') then
+    return el.content
+  end
+  return strip_attr(el)
+end
+
+function Link(el)
+  if is_internal(el.target) then
+    return el.content
+  end
+  return strip_attr(el)
+end
+
+function Str(el)
+  -- Left over (\l) escapes from Word hyperlink fields
+  if el.text:find('(\\l)', 1, true) then
+    return pandoc.Str((el.text:gsub('%(\\l%)', '')))
+  end
+end
+
+function Para(el)
+  -- Paragraphs left empty once the anchors are gone
+  if #el.content == 0 then
+    return {}
+  end
+end
+
+Header = strip_attr
+Div = strip_attr
+Code = strip_attr
+CodeBlock = strip_attr
+Image = strip_attr
+Table = strip_attr
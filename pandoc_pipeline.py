@@ -0,0 +1,91 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import instrumentation
+
+# Lua filter doing the anchor/id/attribute clean up inside pandoc
+FILTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pandoc_clean.lua')
+# Bump when the pandoc command line changes the output
+PIPELINE_VERSION = '1'
+
+
+def convert_docx_bytes_to_html(data, standalone=True, title=None):
+    """Convert docx bytes to cleaned HTML with a single pandoc call over stdin/stdout."""
+    command = ['pandoc', '-f', 'docx', '-t', 'html', '--lua-filter', FILTER_PATH]
+    if standalone:
+        command += ['--standalone', '--metadata', f'pagetitle={title or "document"}']
+
+    with instrumentation.span('pandoc'):
+        result = subprocess.run(command, input=data, capture_output=True, check=True)
+    return result.stdout.decode('utf-8')
+
+
+def convert_docx_to_html(input_file, output_file=None, standalone=True):
+    # Replaces: pandoc -> output.md, clean_md.py, pandoc -> output.html, clean_html.py
+    with open(input_file, 'rb') as f:
+        data = f.read()
+
+    title = os.path.splitext(os.path.basename(input_file))[0]
+    html = convert_docx_bytes_to_html(data, standalone=standalone, title=title)
+
+    if output_file:
+        with instrumentation.span('file.write'), open(output_file, 'w', encoding='utf-8') as f:
+            f.write(html)
+        instrumentation.count('bytes_out', os.path.getsize(output_file))
+    return html
+
+
+def _legacy_pipeline(input_file, work_dir):
+    # The four step workflow from the README, kept only to benchmark against
+    from clean_html import clean_html
+    from clean_md import clean_markdown
+
+    md_file = os.path.join(work_dir, 'output.md')
+    md_cleaned = os.path.join(work_dir, 'output_cleaned.md')
+    html_file = os.path.join(work_dir, 'output.html')
+    html_cleaned = os.path.join(work_dir, 'output_cleaned.html')
+
+    subprocess.run(['pandoc', '-s', input_file, '-t', 'markdown', '-o', md_file], check=True)
+    clean_markdown(md_file, md_cleaned)
+    subprocess.run(['pandoc', '-s', md_cleaned, '-o', html_file], check=True)
+    clean_html(html_file, html_cleaned)
+
+
+def benchmark(input_file, repeat=5):
+    """Time the README workflow against the fused pipeline, returns mean seconds per document."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            _legacy_pipeline(input_file, work_dir)
+        legacy = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            convert_docx_to_html(input_file)
+        fused = (time.perf_counter() - start) / repeat
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f"four step workflow: {legacy * 1000:.1f} ms/document")
+    print(f"fused pipeline:     {fused * 1000:.1f} ms/document ({legacy / fused:.1f}x faster)")
+    return {'legacy': legacy, 'fused': fused}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a .docx to cleaned HTML in one pandoc call')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default='output_cleaned.html')
+    parser.add_argument('--benchmark', action='store_true', help='compare against the four step workflow')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.input_file, repeat=args.repeat)
+    else:
+        convert_docx_to_html(args.input_file, args.output_file)
+        print(f"Converted {args.input_file} to {args.output_file}")
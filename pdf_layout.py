@@ -0,0 +1,396 @@
+import html
+import re
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import instrumentation
+from pdf_pages import (OCR_MIN_CHARS, SECTION_OVERRUN, SectionBreak, iter_text_layer, ocr_scanned_pages,
+                       page_image_tags)
+
+# Layout aware PDF extraction for main5 --layout. Instead of guessing structure
+# from the text with regexes, every text line keeps its font size, weight and
+# position from get_text("dict"). They go into NumPy arrays per page, and lines
+# are classified with statistics of the whole document:
+#   - the body text size is the most common size in the font size histogram
+#     (weighted by characters), clearly larger sizes are heading levels
+#   - short lines that are bold throughout are headings one level below those
+#   - lines in the top/bottom margin that repeat on many pages (digits ignored,
+#     so "Page 3 of 40" matches "Page 4 of 40") are running headers/footers and
+#     are dropped, as are bare page numbers there
+#   - lines starting with a bullet or (1), 1., (a), (iv) are list items
+# Paragraphs break where the gap to the line above is larger than the line
+# spacing, and carry over to the next page when the sentence does. A CONTENTS
+# line starts a contents table, as in main5.
+
+# The statistics come from the first SAMPLE_PAGES pages, which are the only ones
+# held in memory at once
+SAMPLE_PAGES = 30
+MARGIN_BAND = 0.08  # Share of the page height at the top and bottom where headers/footers live
+REPEAT_SHARE = 0.5  # A margin line on at least this share of the sampled pages is a header/footer
+HEADING_RATIO = 1.15  # Lines this much larger than the body text are headings
+MAX_HEADING_LEVEL = 4
+MAX_BOLD_HEADING_CHARS = 80
+PARAGRAPH_GAP = 0.6  # A gap of more than this many font sizes between lines starts a new paragraph
+
+BOLD_FLAG = 16  # fitz.TEXT_FONT_BOLD
+BODY, HEADING, LIST_ITEM, FURNITURE, CONTENTS_ROW = 0, 1, 2, 3, 4
+
+BULLET_PATTERN = re.compile(r'[•●▪◦‣⁃·\uf0b7–*-]\s+')  # \uf0b7 is the Symbol font bullet of Word exports
+NUMBER_PATTERN = r'(?:\(?\d{1,3}\)|\d{1,3}\.(?!\d)|\(?[a-z]\)|\([ivxl]+\))\s+'
+LIST_PATTERN = re.compile(f'{BULLET_PATTERN.pattern}|{NUMBER_PATTERN}')
+DIGITS_PATTERN = re.compile(r'\d+')
+PAGE_NUMBER_PATTERN = re.compile(r'(?i:page\s+)?\d+(?:\s*(?:of|/)\s*\d+)?')
+SENTENCE_END = ('.', ':', ';', '?', '!')
+# A "Contents" line starts the contents table, which runs while the lines are
+# numbered clauses (like main5) or end in a dot leader and page number
+CONTENTS_PATTERN = re.compile(r'(?i:(?:table of )?contents?:?)')
+CONTENTS_ENTRY_PATTERN = re.compile(r'\d+\.\s|.*\.{3,}\s*\d+$')
+CONTENTS_LEADER_PATTERN = re.compile(r'(.*?)\s*\.{2,}\s*(\S+)$')
+
+
+class PageLayout:
+    # The text lines of one page, one array element per line, plus what can be
+    # worked out from the page alone, so it's done where the page is read
+    __slots__ = ('text', 'size', 'bold', 'x0', 'y0', 'y1', 'chars', 'height', 'list_item', 'margin', 'contents')
+
+    def __init__(self, text, size, bold, x0, y0, y1, chars, height):
+        self.text = text  # list of str
+        self.size = size  # largest font size in the line
+        self.bold = bold  # every span of the line is bold
+        self.x0 = x0
+        self.y0 = y0  # top and bottom of the line, points from the top of the page
+        self.y1 = y1
+        self.chars = chars
+        self.height = height
+        match = LIST_PATTERN.match
+        self.list_item = np.fromiter(map(bool, map(match, text)), dtype=bool, count=len(text))
+        # (line, _furniture_key) of the lines inside the top or bottom MARGIN_BAND
+        band = height * MARGIN_BAND
+        self.margin = [(i, _furniture_key(text[i], bool(y0[i] < height / 2)))
+                       for i in np.flatnonzero((y1 <= band) | (y0 >= height - band)).tolist()]
+        self.contents = any(map(CONTENTS_PATTERN.fullmatch, text))  # a CONTENTS table starts here
+
+
+def _furniture_key(line, top):
+    # What a running header/footer line looks like on every page: its side and
+    # its text without digits. None for a bare page number, dropped wherever it is
+    if PAGE_NUMBER_PATTERN.fullmatch(line):
+        return None
+    return top, DIGITS_PATTERN.sub('#', line.lower())
+
+
+def page_layout(page):
+    # get_text("dict") without images, flattened into per line arrays. Lines of a
+    # single span, most of them, skip the per span work
+    text, rows = [], []
+    for block in page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT)['blocks']:
+        for line in block.get('lines', ()):
+            spans = line['spans']
+            if len(spans) == 1:
+                span = spans[0]
+                content = span['text'].strip()
+                if not content:
+                    continue
+                size, bold = span['size'], span['flags'] & BOLD_FLAG or 'Bold' in span['font']
+            else:
+                content = ''.join(span['text'] for span in spans).strip()
+                spans = [span for span in spans if span['text'].strip()]
+                if not spans:
+                    continue
+                size = max(span['size'] for span in spans)
+                bold = all(span['flags'] & BOLD_FLAG or 'Bold' in span['font'] for span in spans)
+            text.append(content)
+            x0, y0, _, y1 = line['bbox']
+            rows.append((size, bold, x0, y0, y1, len(content)))
+    columns = np.array(rows, dtype=float).reshape(-1, 6).T
+    return PageLayout(text, columns[0], columns[1].astype(bool), columns[2], columns[3], columns[4],
+                      columns[5], page.rect.height)
+
+
+def read_page(page, ocr=False):
+    # main5.page_lines for layout mode: (PageLayout, whether it looks like a scan)
+    layout = page_layout(page)
+    return layout, ocr and layout.chars.sum() < OCR_MIN_CHARS and bool(page.get_images())
+
+
+class LayoutStats:
+    """Font size histogram and running headers/footers of a document, from a
+    sample of its pages."""
+
+    def __init__(self, layouts):
+        layouts = [layout for layout in layouts if len(layout.text)]
+        if layouts:
+            sizes = np.round(np.concatenate([layout.size for layout in layouts]) * 2) / 2
+            chars = np.concatenate([layout.chars for layout in layouts])
+        else:
+            sizes = chars = np.zeros(0)
+        if len(sizes):
+            values, inverse = np.unique(sizes, return_inverse=True)
+            self.body_size = float(values[np.argmax(np.bincount(inverse, weights=chars))])
+        else:
+            self.body_size = 0.0
+        # Ascending, the largest HEADING_LEVELS - 1 sizes above the body text
+        larger = np.unique(sizes[sizes >= self.body_size * HEADING_RATIO]) if self.body_size else sizes
+        self.heading_sizes = larger[-(MAX_HEADING_LEVEL - 1):]
+
+        pages_with = {}
+        for layout in layouts:
+            for key in {key for _, key in layout.margin if key is not None}:
+                pages_with[key] = pages_with.get(key, 0) + 1
+        needed = max(2, REPEAT_SHARE * len(layouts))
+        self.furniture = {key for key, count in pages_with.items() if count >= needed}
+
+        # Sections split at the largest heading seen on more than one page, so a
+        # document title that appears once doesn't count as a top-level heading
+        pages_with = {}
+        for layout in layouts:
+            kinds, levels = self.classify(layout)
+            for level in set(levels[kinds == HEADING].tolist()):
+                pages_with[level] = pages_with.get(level, 0) + 1
+        self.section_level = min((level for level, count in pages_with.items() if count >= 2), default=1)
+
+    def classify(self, layout):
+        # (kind, heading level) arrays for the lines of a page
+        count = len(layout.text)
+        kinds = np.full(count, BODY, dtype=np.int8)
+        levels = np.zeros(count, dtype=np.int8)
+        if not count:
+            return kinds, levels
+
+        rounded = np.round(layout.size * 2) / 2
+        if self.body_size:
+            large = rounded >= self.body_size * HEADING_RATIO
+        else:
+            large = np.zeros(count, dtype=bool)  # no text in the sample to compare sizes with
+        levels[large] = len(self.heading_sizes) - np.searchsorted(self.heading_sizes, rounded[large], side='right') + 1
+        bold_heading = ~large & layout.bold & (layout.chars <= MAX_BOLD_HEADING_CHARS)
+        levels[bold_heading] = len(self.heading_sizes) + 1
+        np.clip(levels, 0, MAX_HEADING_LEVEL, out=levels)
+        kinds[large | bold_heading] = HEADING
+
+        kinds[(kinds == BODY) & layout.list_item] = LIST_ITEM
+        furniture = self.furniture
+        kinds[[i for i, key in layout.margin if key is None or key in furniture]] = FURNITURE
+        return kinds, levels
+
+
+def page_blocks(layout, kinds, levels, start=0, stop=None):
+    """The headings, paragraphs and list items of lines start..stop of a page as
+    (kind, level, text), running headers/footers left out. kinds and levels come
+    from LayoutStats.classify. A new block starts where the gap to the line above
+    is wider than the line spacing, at a jump back up the page (the next column),
+    at every list item and where headings start or end."""
+    keep = np.flatnonzero(kinds[start:stop] != FURNITURE) + start
+    if not len(keep):
+        return []
+    kinds, levels, size = kinds[keep], levels[keep], layout.size[keep]
+    gaps = layout.y0[keep][1:] - layout.y1[keep][:-1]
+    heading = kinds == HEADING
+    starts = np.ones(len(keep), dtype=bool)
+    starts[1:] = ((gaps > size[1:] * PARAGRAPH_GAP) | (gaps < -size[1:]) | (kinds[1:] == LIST_ITEM)
+                  | (heading[1:] != heading[:-1]) | (levels[1:] != levels[:-1]))
+    bounds = np.append(np.flatnonzero(starts), len(keep)).tolist()
+    text = [layout.text[i] for i in keep.tolist()]
+    kinds, levels = kinds.tolist(), levels.tolist()  # plain ints compare much faster than NumPy scalars
+    return [(kinds[a], levels[a], ' '.join(text[a:b])) for a, b in zip(bounds, bounds[1:])]
+
+
+def contents_row(line):
+    # A contents entry as a table row, the page number after the dot leader in its own cell
+    match = CONTENTS_LEADER_PATTERN.match(line)
+    if match:
+        return (f'<tr><td>{html.escape(match.group(1))}</td>'
+                f'<td style="text-align: right;">{html.escape(match.group(2))}</td></tr>')
+    return f'<tr><td colspan="2">{html.escape(line)}</td></tr>'
+
+
+def contents_blocks(layout, kinds, levels, in_contents):
+    """page_blocks for a page with (part of) a CONTENTS table on it. Each entry
+    becomes a CONTENTS_ROW block of its own, so the line after the table is never
+    joined onto the last entry. Returns (blocks, whether the table carries on to
+    the next page)."""
+    blocks = []
+    start = 0  # first line not in a block yet
+    for i, kind in enumerate(kinds.tolist()):
+        if kind == FURNITURE:
+            continue
+        line = layout.text[i]
+        if in_contents:
+            if CONTENTS_ENTRY_PATTERN.match(line):
+                blocks.append((CONTENTS_ROW, 0, contents_row(line)))
+                start = i + 1
+                continue
+            in_contents = False
+        elif CONTENTS_PATTERN.fullmatch(line):
+            blocks += page_blocks(layout, kinds, levels, start, i)
+            if kind == HEADING:
+                blocks.append((HEADING, int(levels[i]), line))
+            in_contents, start = True, i + 1
+    if not in_contents:
+        blocks += page_blocks(layout, kinds, levels, start)
+    return blocks, in_contents
+
+
+def text_blocks(lines):
+    # Blocks of an OCR'd page, blank lines end paragraphs
+    blocks, paragraph = [], []
+    for line in lines:
+        if line:
+            paragraph.append(line)
+        elif paragraph:
+            blocks.append((BODY, 0, ' '.join(paragraph)))
+            paragraph = []
+    if paragraph:
+        blocks.append((BODY, 0, ' '.join(paragraph)))
+    return blocks
+
+
+def _with_images(file_path, pages, assets):
+    # (page, whether it was OCR'd) pairs to (page, the <img> tags of its images)
+    doc = fitz.open(file_path)
+    try:
+        for page_num, (page, ocred) in enumerate(pages):
+            if assets is None:
+                yield page, ''
+                continue
+            with instrumentation.span('pdf.images'):
+                yield page, page_image_tags(doc.load_page(page_num), assets, ocred)
+    finally:
+        doc.close()
+
+
+class _Writer:
+    # Turns blocks into HTML in self.out. The last block is held back until the
+    # next one arrives, since a paragraph can carry on over a page break, and the
+    # open list carries over too.
+    def __init__(self):
+        self.out = []
+        self.paragraphs = 0
+        self.kind = None
+        self.level = 0
+        self.text = ''
+        self.list_type = None
+        self.contents = False  # inside a contents <table>
+
+    def flush(self):
+        if self.kind is None:
+            return
+        if self.kind == HEADING:
+            tag = f'h{self.level}'
+        else:
+            tag = 'li' if self.kind == LIST_ITEM else 'p'
+            self.paragraphs += 1
+        self.out.append(f'<{tag}>{html.escape(self.text)}</{tag}>')
+        self.kind = None
+
+    def close_list(self):
+        self.flush()
+        if self.contents:
+            self.out.append('</table>')
+            instrumentation.count('tables')
+            self.contents = False
+        if self.list_type:
+            self.out.append(f'</{self.list_type}>')
+            self.list_type = None
+
+    def block(self, kind, level, text, first=False):
+        # The first block of a page carries on the last paragraph or list item of
+        # the page before when that one did not end a sentence
+        if kind == CONTENTS_ROW:
+            if not self.contents:
+                self.close_list()
+                self.out.append('<table>')
+                self.contents = True
+            self.out.append(text)
+            return
+        if self.contents:
+            self.out.append('</table>')
+            instrumentation.count('tables')
+            self.contents = False
+        if (first and kind == BODY and self.kind in (BODY, LIST_ITEM)
+                and not self.text.endswith(SENTENCE_END)):
+            self.text += ' ' + text
+            return
+        self.flush()
+        if kind == LIST_ITEM:
+            if BULLET_PATTERN.match(text):
+                list_type, text = 'ul', BULLET_PATTERN.sub('', text, count=1)
+            else:
+                list_type = 'ol'  # the document's own numbering is kept as text
+            if list_type != self.list_type:
+                self.close_list()
+                self.list_type = list_type
+                self.out.append('<ul>' if list_type == 'ul' else '<ol style="list-style-type: none;">')
+        elif self.list_type:
+            self.close_list()
+        self.kind, self.level, self.text = kind, level, text
+
+    def take(self):
+        # The HTML finished so far as one fragment
+        instrumentation.count('paragraphs', self.paragraphs)
+        fragment = '\n'.join(self.out)
+        self.out = []
+        self.paragraphs = 0
+        return fragment
+
+
+def iter_layout_fragments(pages, section_pages=None, split_headings=False):
+    # HTML fragments from (PageLayout or OCR'd lines, image tags) pages, about one
+    # per page. With section_pages/split_headings a SectionBreak is yielded like
+    # main5 does for clauses, at top-level headings instead of numbered clauses.
+    pages = iter(pages)
+    sample = []
+    for page in pages:
+        sample.append(page)
+        if len(sample) == SAMPLE_PAGES:
+            break
+    stats = LayoutStats([layout for layout, _ in sample if isinstance(layout, PageLayout)])
+
+    writer = _Writer()
+    splitting = bool(section_pages or split_headings)
+    section_start = 0
+    section_blocks = 0
+    in_contents = False
+    for page_num, (layout, images) in enumerate(_chain(sample, pages)):
+        if isinstance(layout, PageLayout):
+            kinds, levels = stats.classify(layout)
+            if in_contents or layout.contents:
+                blocks, in_contents = contents_blocks(layout, kinds, levels, in_contents)
+            else:
+                blocks = page_blocks(layout, kinds, levels)
+        else:
+            in_contents = False
+            blocks = text_blocks(layout)
+        for i, (kind, level, text) in enumerate(blocks):
+            section_blocks += 1
+            if (splitting and section_blocks > 1 and (i or kind != BODY) and kind != CONTENTS_ROW
+                    and (not section_pages or page_num - section_start >= section_pages)
+                    and (not split_headings or (kind == HEADING and level == stats.section_level)
+                         or section_pages and page_num - section_start >= section_pages * SECTION_OVERRUN)):
+                writer.close_list()
+                yield writer.take()
+                yield SectionBreak(page_num + 1, text if kind == HEADING else None)
+                section_start, section_blocks = page_num, 1
+            writer.block(kind, level, text, first=not i)
+        if images:
+            writer.close_list()
+            writer.out.append(f'<p>{images}</p>')
+        if writer.out:
+            yield writer.take()
+    writer.close_list()
+    yield writer.take()
+
+
+def _chain(sample, pages):
+    yield from sample
+    yield from pages
+
+
+def iter_pdf_file(file_path, workers=1, ocr=True, assets=None, section_pages=None, split_headings=False):
+    # main5.iter_pdf_file with layout classification. Pages are read in the same
+    # parallel page ranges as main5 and scanned pages OCR'd the same way
+    pages = iter_text_layer(file_path, workers, ocr, read_page)
+    if ocr:
+        pages = ocr_scanned_pages(file_path, pages, workers)
+    return iter_layout_fragments(_with_images(file_path, pages, assets), section_pages, split_headings)
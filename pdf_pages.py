@@ -0,0 +1,189 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+import instrumentation
+
+# What main5 and pdf_layout share: reading the text layer of a PDF in parallel
+# page ranges, OCR of scanned pages, the images of a page and the SectionBreak
+# marker. It lives here rather than in main5 because main5 also runs as a
+# script, and importing it from pdf_layout would load a second copy whose
+# SectionBreak is a different class from the one write_sections checks for.
+
+# Documents shorter than this are not worth starting worker processes for
+PARALLEL_MIN_PAGES = 32
+# Pages a worker extracts in one go
+PARALLEL_MAX_RANGE = 64
+
+# With section_pages and split_clauses together, a section still waiting for a
+# clause after this many times section_pages pages is split at the next paragraph
+SECTION_OVERRUN = 2
+
+# A page with less text than this and at least one image on it is taken to be a
+# scan and is OCR'd instead. Pages are rendered at OCR_DPI for tesseract.
+OCR_MIN_CHARS = 20
+OCR_DPI = 300
+OCR_LANG = 'eng'
+
+# An image covering more than this share of its page is the scan of the page
+# itself, left out when the page is OCR'd
+FULL_PAGE_IMAGE = 0.8
+
+_ocr_available = None
+
+
+def ocr_available():
+    # pytesseract and the tesseract binary are only needed once a scanned page turns up
+    global _ocr_available
+    if _ocr_available is None:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            _ocr_available = True
+        except Exception as e:
+            print(f"OCR unavailable, scanned pages keep their (empty) text layer: {e}")
+            _ocr_available = False
+    return _ocr_available
+
+
+def page_lines(page, ocr=False):
+    # The stripped lines of a page and whether it looks like a scan that needs OCR
+    text = page.get_text("text")
+    scanned = ocr and len(text.strip()) < OCR_MIN_CHARS and bool(page.get_images())
+    return [line.strip() for line in text.split('\n')], scanned
+
+
+def extract_page_lines(file_path, start, stop, ocr=False, reader=page_lines):
+    # Runs in a worker process: open the PDF independently and return
+    # reader() (page_lines() by default) for pages start..stop-1
+    doc = fitz.open(file_path)
+    try:
+        return [reader(doc.load_page(page_num), ocr) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+
+def ocr_page(file_path, page_num, dpi=OCR_DPI, lang=OCR_LANG):
+    # Runs in a worker process: render one page in grayscale and OCR it
+    import pytesseract
+    from PIL import Image
+
+    doc = fitz.open(file_path)
+    try:
+        pixmap = doc.load_page(page_num).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+    finally:
+        doc.close()
+    text = pytesseract.image_to_string(image, lang=lang)
+    return [line.strip() for line in text.split('\n')]
+
+
+def ocr_scanned_pages(file_path, pages, workers=1):
+    # Replaces the lines of scanned pages with OCR text while keeping page order.
+    # Yields (lines, whether the page was OCR'd), like the (lines, scanned) pairs
+    # it is given but False for scans left alone because OCR is unavailable.
+    # OCR jobs go to a pool as soon as a scanned page is found; the pages after it
+    # wait in a short queue so only a few pages are ever held in memory.
+    pending = deque()
+    max_pending = (workers or os.cpu_count() or 1) * 4
+    executor = None
+    try:
+        for page_num, (lines, scanned) in enumerate(pages):
+            ocred = scanned and ocr_available()
+            if ocred:
+                instrumentation.count('ocr_pages')
+                if workers == 1:
+                    with instrumentation.span('ocr.page'):
+                        lines = ocr_page(file_path, page_num)
+                else:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=workers)
+                    lines = executor.submit(ocr_page, file_path, page_num)
+            pending.append((lines, ocred))
+
+            while pending and (not isinstance(pending[0][0], Future) or pending[0][0].done()
+                               or len(pending) > max_pending):
+                head, ocred = pending.popleft()
+                yield head.result() if isinstance(head, Future) else head, ocred
+
+        while pending:
+            head, ocred = pending.popleft()
+            yield head.result() if isinstance(head, Future) else head, ocred
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def iter_text_layer(file_path, workers=1, ocr=False, reader=page_lines):
+    # Yields page_lines() (or reader(), a module level function taking the same
+    # arguments) for every page in order. With several workers the pages are
+    # split into ranges extracted in parallel; only the text extraction happens in
+    # the workers, so results are identical to a serial run.
+    with instrumentation.span('pdf.open'):
+        doc = fitz.open(file_path)
+    page_count = len(doc)
+
+    if workers == 1 or page_count < PARALLEL_MIN_PAGES:
+        try:
+            for page_num in range(page_count):
+                with instrumentation.span('pdf.page'):
+                    page = reader(doc.load_page(page_num), ocr)
+                instrumentation.count('pages')
+                yield page
+        finally:
+            doc.close()
+        return
+    doc.close()
+
+    workers = workers or os.cpu_count() or 1
+    # A few ranges per worker so one slow range does not hold up the others, but
+    # never more than PARALLEL_MAX_RANGE pages each
+    range_size = max(1, min(-(-page_count // (workers * 4)), PARALLEL_MAX_RANGE))
+    ranges = iter(range(0, page_count, range_size))
+    # Only a couple of ranges per worker are submitted ahead of the one being read, so
+    # memory stays the same however long the document is
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in ranges:
+            pending.append(executor.submit(extract_page_lines, file_path, start,
+                                           min(start + range_size, page_count), ocr, reader))
+            if len(pending) < workers * 2:
+                continue
+            pages = pending.popleft().result()
+            instrumentation.count('pages', len(pages))
+            yield from pages
+        while pending:
+            pages = pending.popleft().result()
+            instrumentation.count('pages', len(pages))
+            yield from pages
+
+
+def page_image_tags(page, assets, ocred=False):
+    # <img> tags for the images drawn on a page, stored through the AssetStore.
+    # Sizes come from where the image is placed, PDF points to CSS pixels. On a
+    # page that was OCR'd the image covering the page is the scan itself and is
+    # left out; full page letterheads and backgrounds of other pages are kept.
+    tags = []
+    seen = set()
+    page_area = page.rect.width * page.rect.height
+    for info in page.get_image_info(xrefs=True):
+        xref = info.get('xref')
+        if not xref or xref in seen:
+            continue  # inline images have no xref, and a repeated image is shown once
+        seen.add(xref)
+        bbox = fitz.Rect(info['bbox'])
+        if ocred and bbox.width * bbox.height > page_area * FULL_PAGE_IMAGE:
+            continue
+        image = page.parent.extract_image(xref)
+        if image:
+            tags.append(assets.img_tag(image['image'], (bbox.width * 96 / 72, bbox.height * 96 / 72)))
+    return ''.join(tags)
+
+
+class SectionBreak:
+    # Yielded between sections by main5.iter_pdf_fragments and pdf_layout when they are asked to split
+    def __init__(self, page, title=None):
+        self.page = page  # 1-based page the new section starts on
+        self.title = title  # the clause that starts it, if it starts at one
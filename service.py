@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+import converters
+
+# A local conversion daemon: the converters stay imported in a pool of worker
+# processes, so a small file costs milliseconds instead of a fresh python start.
+#
+#   POST /convert  JSON {"input": path, "output": path, "format": ..., "options": {...}}
+#                  ("output" only inside --output-root), or the file itself as the body
+#                  with ?filename=name.docx (&format=, &options=JSON), which answers with the HTML
+#   GET  /stats    queue depth, counts and latency percentiles
+#   GET  /health
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+QUEUE_SIZE = 64  # jobs waiting for a worker before new ones are turned away with a 503
+MAX_BODY_BYTES = 200 * 1024 * 1024
+LATENCY_WINDOW = 1000  # latency percentiles cover this many of the latest jobs
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def run_job(format, input_path, output_path, options):
+    # Runs in a worker process, where converters.warm() already imported the backends
+    start = time.perf_counter()
+    converters.convert(input_path, output_path, format, **options)
+    return time.perf_counter() - start
+
+
+def _ping(_):
+    return os.getpid()
+
+
+def _percentiles(values):
+    # p50/p95/max in milliseconds
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    values = sorted(values)
+    pick = lambda share: round(values[min(len(values) - 1, int(share * len(values)))] * 1000, 1)
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'max': round(values[-1] * 1000, 1)}
+
+
+class ConversionService:
+    """Bounded job queue in front of a pool of warm worker processes.
+
+    One dispatcher task per worker takes jobs off the queue, so at most
+    `workers` conversions run at once and at most queue_size wait. A full queue
+    rejects new jobs straight away instead of letting them pile up.
+    """
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE, formats=None, output_root=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.formats = formats
+        # Folder that client chosen output paths must be in; None refuses them
+        self.output_root = os.path.realpath(output_root) if output_root else None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = self._new_executor()
+        self.counts = Counter()
+        self.by_format = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # (queue wait, run, total) seconds
+        self.running = 0
+        self.started = time.time()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=converters.warm,
+                                   initargs=(self.formats,))
+
+    def warm_up(self):
+        # Start every worker (and import the backends in it) before the first request
+        list(self.executor.map(_ping, range(self.workers)))
+
+    async def submit(self, format, input_path, output_path, options):
+        """Queue a conversion and wait for it. Returns (queue wait, run) seconds,
+        raises asyncio.QueueFull when the queue has no room."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((future, time.perf_counter(), format, input_path, output_path, options))
+        except asyncio.QueueFull:
+            self.counts['rejected'] += 1
+            raise
+        self.counts['accepted'] += 1
+        return await future
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            future, queued_at, format, input_path, output_path, options = await self.queue.get()
+            started = time.perf_counter()
+            executor = self.executor
+            self.running += 1
+            try:
+                if future.cancelled():
+                    continue  # the client went away while the job was waiting
+                run = await loop.run_in_executor(executor, run_job, format, input_path, output_path, options)
+            except BrokenProcessPool as e:
+                # A worker died (out of memory, a crashing library); start a fresh pool
+                if self.executor is executor:
+                    self.executor = self._new_executor()
+                    executor.shutdown(wait=False)
+                self._failed(future, e)
+            except Exception as e:
+                self._failed(future, e)
+            else:
+                wait = started - queued_at
+                self.latencies.append((wait, run, time.perf_counter() - queued_at))
+                self.counts['completed'] += 1
+                self.by_format[format] += 1
+                if not future.done():
+                    future.set_result((wait, run))
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+
+    def _failed(self, future, error):
+        self.counts['failed'] += 1
+        if not future.done():
+            future.set_exception(error)
+
+    def stats(self):
+        waits, runs, totals = zip(*self.latencies) if self.latencies else ((), (), ())
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'running': self.running,
+            'workers': self.workers,
+            'accepted': self.counts['accepted'],
+            'completed': self.counts['completed'],
+            'failed': self.counts['failed'],
+            'rejected': self.counts['rejected'],
+            'by_format': dict(self.by_format),
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'latency_ms': {'queue_wait': _percentiles(waits), 'run': _percentiles(runs), 'total': _percentiles(totals)},
+        }
+
+    async def handle(self, reader, writer):
+        # One request per connection
+        headers = {'Content-Type': 'application/json'}
+        try:
+            status, body, headers = await self._respond(reader, headers)
+        except HTTPError as e:
+            status, body = e.status, json.dumps({'error': str(e)}).encode('utf-8')
+        except asyncio.QueueFull:
+            status, body = 503, json.dumps({'error': 'queue full, try again later'}).encode('utf-8')
+            headers['Retry-After'] = '1'
+        except Exception as e:
+            status, body = 500, json.dumps({'error': str(e) or type(e).__name__}).encode('utf-8')
+
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}", 'Connection: close']
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader, headers):
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+        request_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            request_headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(request_headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, 'Content-Length is not a number')
+        if length < 0:
+            raise HTTPError(400, 'Content-Length is negative')
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b''
+
+        url = urlsplit(target)
+        if url.path in ('/stats', '/health'):
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            result = self.stats() if url.path == '/stats' else {'status': 'ok'}
+            return 200, json.dumps(result).encode('utf-8'), headers
+        if url.path != '/convert':
+            raise HTTPError(404, f"no such endpoint {url.path}")
+        if method != 'POST':
+            raise HTTPError(405, 'use POST')
+
+        if request_headers.get('content-type', '').startswith('application/json'):
+            return 200, json.dumps(await self._convert_path(body)).encode('utf-8'), headers
+        html = await self._convert_bytes(body, parse_qs(url.query))
+        headers['Content-Type'] = 'text/html; charset=utf-8'
+        return 200, html, headers
+
+    async def _convert_path(self, body):
+        # The input is a file the service can read, the output is left on disk
+        try:
+            job = json.loads(body)
+            input_path = job['input']
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, 'expected a JSON object with at least "input"')
+        if not os.path.isfile(input_path):
+            raise HTTPError(400, f"no such file {input_path}")
+        format = self._check_format(job.get('format') or self._format_for(input_path))
+        options = self._check_options(job.get('options') or {})
+        if job.get('output'):
+            output_path = self._output_path(job['output'])
+        else:
+            output_path = converters.output_path_for(input_path, os.path.dirname(input_path), format)
+        wait, run = await self.submit(format, input_path, output_path, options)
+        return {'output': output_path, 'format': format,
+                'queue_wait_ms': round(wait * 1000, 1), 'run_ms': round(run * 1000, 1)}
+
+    async def _convert_bytes(self, body, query):
+        # The input is the request body, the HTML goes back in the response
+        filename = os.path.basename((query.get('filename') or [''])[0])
+        if not filename or not body:
+            raise HTTPError(400, 'send the file as the body with ?filename=<name>')
+        format = self._check_format((query.get('format') or [None])[0] or self._format_for(filename))
+        try:
+            options = self._check_options(json.loads((query.get('options') or ['{}'])[0]))
+        except ValueError:
+            raise HTTPError(400, 'options must be JSON')
+        if format in ('docx', 'pdf'):
+            # Images would land in a temporary folder that is gone after the response
+            options.setdefault('images', False)
+
+        work_dir = tempfile.mkdtemp(prefix='convert-')
+        try:
+            input_path = os.path.join(work_dir, filename)
+            output_path = converters.output_path_for(input_path, work_dir, format)
+            with open(input_path, 'wb') as f:
+                f.write(body)
+            await self.submit(format, input_path, output_path, options)
+            with open(output_path, 'rb') as f:
+                return f.read()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _format_for(self, path):
+        try:
+            return converters.format_for(path)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    def _check_format(self, format):
+        # Caught here so a typo is the client's 400, not a failed job
+        if format not in converters.CONVERTERS:
+            raise HTTPError(400, f"unknown format {format}, expected one of {', '.join(converters.CONVERTERS)}")
+        return format
+
+    def _check_options(self, options):
+        if not isinstance(options, dict):
+            raise HTTPError(400, 'options must be a JSON object')
+        return options
+
+    def _output_path(self, output):
+        # A client chosen output, relative to the output root or absolute inside it.
+        # Symlinks and .. are resolved first so they can't lead out of it.
+        if self.output_root is None:
+            raise HTTPError(400, '"output" is not allowed, start the service with --output-root to choose outputs')
+        if not isinstance(output, str):
+            raise HTTPError(400, '"output" must be a path')
+        path = os.path.realpath(os.path.join(self.output_root, output))
+        if os.path.commonpath([path, self.output_root]) != self.output_root or path == self.output_root:
+            raise HTTPError(400, f"output {output} is outside the output root {self.output_root}")
+        return path
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, workers=None, queue_size=QUEUE_SIZE,
+                formats=None, output_root=None):
+    service = ConversionService(workers, queue_size, formats, output_root)
+    await asyncio.get_running_loop().run_in_executor(None, service.warm_up)
+    dispatchers = [asyncio.create_task(service.dispatch()) for _ in range(service.workers)]
+
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle, path=unix_path)
+        where = unix_path
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving on {where} with {service.workers} workers and a queue of {queue_size}")
+    # A plain kill stops serving and shuts the pool down instead of orphaning the workers
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for task in dispatchers:
+            task.cancel()
+        service.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the converters as a local HTTP service')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', default=None, help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='conversions run at once (defaults to the number of cores)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help='jobs that can wait for a worker before requests get a 503')
+    parser.add_argument('--formats', default=None,
+                        help=f"comma separated formats to preload (default: all of {','.join(converters.BACKENDS)})")
+    parser.add_argument('--output-root', default=None,
+                        help='folder that "output" paths in JSON requests must be in (without it they are refused)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.queue_size,
+                          args.formats.split(',') if args.formats else None, args.output_root))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,48 @@
+import functools
+import hashlib
+import os
+
+from cache import DEFAULT_CACHE_DIR
+
+# The page templates of every converter, loaded from templates/ by theme name.
+# One jinja2 Environment per process keeps each compiled theme in memory, and the
+# compiled bytecode is stored on disk so a new process doesn't compile them again.
+# jinja2 is imported on first use, so THEMES can be read without loading it.
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+BYTECODE_FOLDER = os.path.join(DEFAULT_CACHE_DIR, 'jinja')
+
+# plain: no styling. legal-print: Arial on screen, A4 pages without headings or
+# tables split over a page break when printed. styled-table: bordered, striped tables.
+THEMES = ('plain', 'legal-print', 'styled-table')
+DEFAULT_THEME = 'plain'
+
+
+@functools.lru_cache(maxsize=None)
+def environment():
+    # Created on first use; templates are not reloaded when they change on disk
+    # while the process runs
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    os.makedirs(BYTECODE_FOLDER, exist_ok=True)
+    return Environment(loader=FileSystemLoader(TEMPLATE_FOLDER),
+                       bytecode_cache=FileSystemBytecodeCache(BYTECODE_FOLDER),
+                       trim_blocks=True, lstrip_blocks=True, auto_reload=False)
+
+
+def get_template(theme=DEFAULT_THEME):
+    # The compiled page template of a theme, ValueError for an unknown one
+    if theme not in THEMES:
+        raise ValueError(f"Unknown theme {theme}, expected one of {', '.join(THEMES)}")
+    return environment().get_template(f"{theme}.html")
+
+
+@functools.lru_cache(maxsize=None)
+def template_key(theme=DEFAULT_THEME):
+    # The theme plus a hash of every template it could extend, for cache keys:
+    # editing any file in templates/ changes the key
+    digest = hashlib.sha256(theme.encode('utf-8'))
+    for name in sorted(os.listdir(TEMPLATE_FOLDER)):
+        with open(os.path.join(TEMPLATE_FOLDER, name), 'rb') as f:
+            digest.update(b'\0' + name.encode('utf-8') + b'\0' + f.read())
+    return f"{theme}:{digest.hexdigest()}"
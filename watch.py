@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import converters
+
+# Keeps output_folder in step with an intake folder: new and changed files are
+# converted once they stop changing, outputs of deleted files are removed (on
+# start up too, for files deleted while nothing was watching). Only outputs the
+# watcher wrote itself are ever removed, they are listed in STATE_FILE. Each
+# poll is a single os.scandir of the folder, so only the files that changed ever
+# get converted however many are already there.
+
+POLL_SECONDS = 1.0
+# A file has to keep the same size and mtime this long before it is converted,
+# so half copied or still downloading files are left alone
+SETTLE_SECONDS = 2.0
+
+# Lock files, temporary and partial downloads that show up in intake folders
+IGNORED_PREFIXES = ('~$', '.')
+IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', '.partial')
+
+# In output_folder: output file name -> input it was converted from
+STATE_FILE = '.watch-outputs.json'
+
+
+def scan(input_folder, extensions, exclude=()):
+    # path -> (size, mtime in ns) of the inputs directly inside input_folder.
+    # exclude holds file names to leave out, e.g. the watcher's own outputs
+    # when it writes them to the intake folder
+    snapshot = {}
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(IGNORED_PREFIXES) or name.endswith(IGNORED_SUFFIXES) or name in exclude:
+                continue
+            if os.path.splitext(name)[1].lower() not in extensions:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # deleted between listing and stat
+            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def convert_job(input_path, output_path):
+    # Runs in a worker process: returns (seconds, error message or None)
+    start = time.perf_counter()
+    try:
+        converters.convert(input_path, output_path)
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, str(e) or type(e).__name__
+
+
+class FolderWatcher:
+    """Converts what changed in input_folder since the last poll().
+
+    Files are converted by a pool of `workers` processes with the converters
+    already imported, while polling carries on. On start up, files whose
+    output is newer than the input are taken as already converted, and the
+    outputs it wrote on an earlier run for inputs that are gone are removed
+    (see STATE_FILE). Inputs that
+    would write the same output (a.docx and a.pdf both make a.html) are
+    reported and left alone until only one of them is left.
+    """
+
+    def __init__(self, input_folder, output_folder, extensions=None, workers=1, settle=SETTLE_SECONDS):
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.extensions = tuple(extensions or converters.FORMATS_BY_EXTENSION)
+        self.settle = settle
+        self.seen = {}  # path -> (signature, when it was first seen with that signature)
+        self.converted = {}  # path -> signature it was last converted (or failed) at
+        self.running = {}  # path -> (future, signature)
+        self.clashes = set()  # tuples of inputs sharing an output, reported already
+        self.started = False
+        formats = {converters.FORMATS_BY_EXTENSION[e] for e in self.extensions if e in converters.FORMATS_BY_EXTENSION}
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=converters.warm, initargs=(formats,))
+        os.makedirs(output_folder, exist_ok=True)
+        self.state_path = os.path.join(output_folder, STATE_FILE)
+        self.outputs = self._load_outputs()  # output name -> input, of the outputs this watcher wrote
+        self.changed = False  # self.outputs needs saving
+        # Writing into the intake folder, the outputs (e.g. a_cleaned.html) must not be read back as inputs
+        self.same_folder = os.path.samefile(input_folder, output_folder)
+
+    def _load_outputs(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_outputs(self):
+        part_path = self.state_path + '.part'
+        with open(part_path, 'w', encoding='utf-8') as f:
+            json.dump(self.outputs, f, indent=1, sort_keys=True)
+        os.replace(part_path, self.state_path)
+        self.changed = False
+
+    def _scan(self, extensions):
+        return scan(self.input_folder, extensions, self.outputs if self.same_folder else ())
+
+    def output_path(self, input_path):
+        return converters.output_path_for(input_path, self.output_folder)
+
+    def _up_to_date(self, input_path):
+        try:
+            return os.path.getmtime(self.output_path(input_path)) >= os.path.getmtime(input_path)
+        except OSError:
+            return False
+
+    def _remove_output(self, input_path):
+        # Only an output this watcher wrote, never a file that just has the same name
+        output_path = self.output_path(input_path)
+        if self.outputs.pop(os.path.basename(output_path), None) is None:
+            return
+        self.changed = True
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            print(f"Removed {output_path}, {input_path} is gone")
+
+    def _remove_orphans(self):
+        # Outputs written on an earlier run for inputs deleted while the watcher
+        # wasn't running. Every supported input counts, not only the watched
+        # extensions, so an output another input now writes is kept
+        inputs = self._scan(tuple(converters.FORMATS_BY_EXTENSION))
+        expected = {os.path.basename(self.output_path(path)) for path in inputs}
+        for name, input_path in list(self.outputs.items()):
+            if name in expected:
+                continue
+            del self.outputs[name]
+            self.changed = True
+            output_path = os.path.join(self.output_folder, name)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                print(f"Removed {output_path}, {input_path} is gone")
+
+    def _clashing(self, outputs):
+        # Inputs that would overwrite each other's output, reported when first seen
+        clashes = {tuple(sorted(paths)) for paths in outputs.values() if len(paths) > 1}
+        for paths in clashes - self.clashes:
+            print(f"Not converting {' or '.join(paths)}, they would all be written to "
+                  f"{self.output_path(paths[0])}; rename or remove all but one")
+        self.clashes = clashes
+        return {path for paths in clashes for path in paths}
+
+    def poll(self):
+        """One pass: collect finished conversions, remove outputs of deleted
+        inputs and start converting the files that have settled. Returns the
+        number of conversions still running."""
+        now = time.monotonic()
+        snapshot = self._scan(self.extensions)
+        if not self.started:
+            self._remove_orphans()
+            self.started = True
+        outputs = {}  # output path -> inputs written to it
+        for path in snapshot:
+            outputs.setdefault(self.output_path(path), []).append(path)
+        clashing = self._clashing(outputs)
+
+        for path, (future, signature) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[path]
+            seconds, error = future.result()
+            self.converted[path] = signature
+            if error:
+                print(f"Failed to convert {path}: {error}")
+            elif path in snapshot:
+                print(f"Converted {path} in {seconds:.2f} s")
+
+        for path in list(self.seen):
+            if path not in snapshot and path not in self.running:
+                del self.seen[path]
+                self.converted.pop(path, None)
+                if self.output_path(path) not in outputs:  # else it's another input's output now
+                    self._remove_output(path)
+
+        for path, signature in snapshot.items():
+            if path in self.running or path in clashing or self.converted.get(path) == signature:
+                continue
+            first_seen = self.seen.get(path)
+            if first_seen is None or first_seen[0] != signature:
+                self.seen[path] = (signature, now)  # new or still being written
+                if self.settle > 0:
+                    continue
+            elif now - first_seen[1] < self.settle:
+                continue
+            if path not in self.converted and self._up_to_date(path):
+                self.converted[path] = signature  # converted before this watcher started
+                continue
+            output_path = self.output_path(path)
+            future = self.executor.submit(convert_job, path, output_path)
+            self.running[path] = (future, signature)
+            # Recorded before the output exists, so the next scan already leaves it out
+            self.outputs[os.path.basename(output_path)] = path
+            self.changed = True
+        if self.changed:
+            self._save_outputs()
+        return len(self.running)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def watch(input_folder, output_folder, extensions=None, workers=1, poll_seconds=POLL_SECONDS,
+          settle=SETTLE_SECONDS, once=False):
+    # Poll forever (until Ctrl-C), or with once=True convert what is pending now and return
+    watcher = FolderWatcher(input_folder, output_folder, extensions, workers, 0 if once else settle)
+    print(f"Watching {input_folder} -> {output_folder}")
+    try:
+        while True:
+            running = watcher.poll()
+            if once and not running:
+                break
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert files as they land in a folder')
+    parser.add_argument('input_folder', nargs='?', default='files')
+    parser.add_argument('output_folder', nargs='?', default='output')
+    parser.add_argument('--extensions', default=None,
+                        help='comma separated extensions to watch, e.g. .docx,.pdf (default: every supported type)')
+    parser.add_argument('--workers', type=int, default=1, help='files converted at the same time')
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between scans of the folder')
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help='seconds a file must stay unchanged before it is converted')
+    parser.add_argument('--once', action='store_true', help='bring the outputs up to date and exit')
+    args = parser.parse_args()
+
+    extensions = [e if e.startswith('.') else f'.{e}' for e in args.extensions.lower().split(',')] if args.extensions else None
+    watch(args.input_folder, args.output_folder, extensions, args.workers, args.poll, args.settle, args.once)
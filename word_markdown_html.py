@@ -1,112 +1,66 @@
+import argparse
 import fitz  # PyMuPDF
 import docx  # python-docx
 import re
-from jinja2 import Template
+from line_rules import DOCX_RULES, NUMBERED_ITEM_PATTERN, PDF_ANCHOR_RULES
 import os
 from docx import Document
 import subprocess
-
-def read_pdf_file(file_path):
-    try:
+from pandoc_pipeline import FILTER_PATH, PIPELINE_VERSION, convert_docx_to_html
+from cache import ConversionCache
+from html_writer import stream_template
+from templates import THEMES, get_template, template_key
+import instrumentation
+
+# Bump CONVERTER_VERSION whenever the generated HTML changes so cached outputs are not reused
+CONVERTER = 'word_markdown_html.read_pdf_file'
+CONVERTER_VERSION = '2'
+PIPELINE_CONVERTER = 'pandoc_pipeline.convert_docx_to_html'
+with open(FILTER_PATH, encoding='utf-8') as f:
+    PIPELINE_FILTER = f.read()
+
+# Page template of the PDF output, in templates/
+DEFAULT_THEME = 'legal-print'
+
+def iter_pdf_file(file_path):
+    # Yields the HTML fragments of the PDF one at a time
+    with instrumentation.span('pdf.open'):
         doc = fitz.open(file_path)
-        content = []
-        list_stack = []  # Stack to handle nested lists
-        is_contents_section = False
-        contents_table = []
-        paragraph_buffer = []  # Buffer to collect related paragraphs
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text("text")
-
-            print(f"Processing page {page_num + 1}")  # Debugging statement
-
-            for line in text.split('\n'):
-                line = line.strip()
-                # Remove unwanted links and anchors
-                line = re.sub(r'\[.*?\]\{#.*?\}', '', line)
-                if line:
-                    if re.search(r'\bCONTENTS?\b', line.upper()):
-                        is_contents_section = True
-                        contents_table.append("<table>")
-                        continue
-
-                    if is_contents_section:
-                        if not re.match(r'^\d+\.\s', line):
-                            is_contents_section = False
-                            contents_table.append("</table>")
-                            content.extend(contents_table)
-                            contents_table = []
-
-                    if is_contents_section:
-                        formatted_line = format_contents_line(line)
-                        contents_table.append(formatted_line)
-                    else:
-                        if re.match(r'^[0-9]+\.\s', line):
-                            # Line starts with a number followed by a period and a space
-                            line = f"<b>{line}</b>"
-                        paragraph_buffer.append(line)
-
-                elif paragraph_buffer:
-                    # End of a paragraph block
-                    formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
-                    if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                        print(f"Formatted paragraph: {formatted_paragraph}")  # Debugging statement
-                        content.append(formatted_paragraph)
-                    paragraph_buffer = []
-
-        # Handle any remaining paragraphs
-        if paragraph_buffer:
-            formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
-            if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                content.append(formatted_paragraph)
-
-        # Close any remaining open lists
-        while list_stack:
-            list_type = list_stack.pop()
-            content.append(f'</{list_type}>')
-
-        return content
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return []
-
-def read_docx_file(file_path):
-    try:
-        doc = Document(file_path)
-        content = []
-        list_stack = []  # Stack to handle nested lists
-        is_contents_section = False
-        contents_table = []
-        paragraph_buffer = []  # Buffer to collect related paragraphs
-
-        for paragraph in doc.paragraphs:
-            line = paragraph.text.strip()
-
+    list_stack = []  # Stack to handle nested lists
+    is_contents_section = False
+    contents_table = []
+    paragraph_buffer = []  # Buffer to collect related paragraphs
+
+    for page_num in range(len(doc)):
+        with instrumentation.span('pdf.page'):
+            text = doc.load_page(page_num).get_text("text")
+        instrumentation.count('pages')
+
+        for line in text.split('\n'):
+            line = line.strip()
             # Remove unwanted links and anchors
-            line = re.sub(r'\[.*?\]\{#.*?\}', '', line)
-
-            # Remove content inside curly braces {}
-            line = re.sub(r'\{.*?\}', '', line)
-
+            line = PDF_ANCHOR_RULES.strip(line)
             if line:
-                if re.search(r'\bCONTENTS?\b', line.upper()):
+                # One regex match per line decides what kind of line it is
+                kind = PDF_ANCHOR_RULES.classify(line)
+                if kind == 'contents':
                     is_contents_section = True
                     contents_table.append("<table>")
                     continue
 
                 if is_contents_section:
-                    if not re.match(r'^\d+\.\s', line):
+                    if kind != 'numbered_clause':
                         is_contents_section = False
                         contents_table.append("</table>")
-                        content.extend(contents_table)
+                        instrumentation.count('tables')
+                        yield from contents_table
                         contents_table = []
 
                 if is_contents_section:
                     formatted_line = format_contents_line(line)
                     contents_table.append(formatted_line)
                 else:
-                    if re.match(r'^[0-9]+\.\s', line):
+                    if kind == 'numbered_clause':
                         # Line starts with a number followed by a period and a space
                         line = f"<b>{line}</b>"
                     paragraph_buffer.append(line)
@@ -115,22 +69,92 @@ def read_docx_file(file_path):
                 # End of a paragraph block
                 formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
                 if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                    print(f"Formatted paragraph: {formatted_paragraph}")  # Debugging statement
-                    content.append(formatted_paragraph)
+                    instrumentation.count('paragraphs')
+                    yield formatted_paragraph
                 paragraph_buffer = []
 
-        # Handle any remaining paragraphs
-        if paragraph_buffer:
+    # Handle any remaining paragraphs
+    if paragraph_buffer:
+        formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
+        if formatted_paragraph.strip():  # Ensure non-empty paragraph
+            instrumentation.count('paragraphs')
+            yield formatted_paragraph
+
+    # Close any remaining open lists
+    while list_stack:
+        list_type = list_stack.pop()
+        yield f'</{list_type}>'
+
+def read_pdf_file(file_path):
+    try:
+        return list(iter_pdf_file(file_path))
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return []
+
+def iter_docx_file(file_path):
+    # Yields the HTML fragments of the document one at a time
+    with instrumentation.span('docx.open'):
+        doc = Document(file_path)
+    list_stack = []  # Stack to handle nested lists
+    is_contents_section = False
+    contents_table = []
+    paragraph_buffer = []  # Buffer to collect related paragraphs
+
+    for paragraph in doc.paragraphs:
+        line = paragraph.text.strip()
+
+        # Remove unwanted links and anchors, and content inside curly braces {}
+        line = DOCX_RULES.strip(line)
+
+        if line:
+            # One regex match per line decides what kind of line it is
+            kind = DOCX_RULES.classify(line)
+            if kind == 'contents':
+                is_contents_section = True
+                contents_table.append("<table>")
+                continue
+
+            if is_contents_section:
+                if kind != 'numbered_clause':
+                    is_contents_section = False
+                    contents_table.append("</table>")
+                    instrumentation.count('tables')
+                    yield from contents_table
+                    contents_table = []
+
+            if is_contents_section:
+                formatted_line = format_contents_line(line)
+                contents_table.append(formatted_line)
+            else:
+                if kind == 'numbered_clause':
+                    # Line starts with a number followed by a period and a space
+                    line = f"<b>{line}</b>"
+                paragraph_buffer.append(line)
+
+        elif paragraph_buffer:
+            # End of a paragraph block
             formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
             if formatted_paragraph.strip():  # Ensure non-empty paragraph
-                content.append(formatted_paragraph)
-
-        # Close any remaining open lists
-        while list_stack:
-            list_type = list_stack.pop()
-            content.append(f'</{list_type}>')
+                instrumentation.count('paragraphs')
+                yield formatted_paragraph
+            paragraph_buffer = []
+
+    # Handle any remaining paragraphs
+    if paragraph_buffer:
+        formatted_paragraph = format_paragraph(paragraph_buffer, list_stack)
+        if formatted_paragraph.strip():  # Ensure non-empty paragraph
+            instrumentation.count('paragraphs')
+            yield formatted_paragraph
+
+    # Close any remaining open lists
+    while list_stack:
+        list_type = list_stack.pop()
+        yield f'</{list_type}>'
 
-        return content
+def read_docx_file(file_path):
+    try:
+        return list(iter_docx_file(file_path))
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
@@ -148,7 +172,8 @@ def format_paragraph(paragraphs, list_stack):
     list_type = None
 
     # Handling bullets and numbering
-    if re.match(r'^\(\d+\)', paragraphs[0]):
+    numbered_list_match = NUMBERED_ITEM_PATTERN.match(paragraphs[0])
+    if numbered_list_match:
         list_type = 'ol'
 
     if list_type:
@@ -166,135 +191,76 @@ def format_paragraph(paragraphs, list_stack):
             formatted_text = f'</{closing_list_type}>{formatted_text}'
 
     # Ensure the numbering format (e.g., "(1)", "(2)") is preserved
-    numbered_list_match = re.match(r'^\(\d+\)', paragraphs[0])
     if numbered_list_match:
         formatted_text = f'{numbered_list_match.group(0)} {formatted_text[len(numbered_list_match.group(0)):].strip()}'
 
     return formatted_text.strip()
 
-def create_jinja2_template(content, template_path, filename):
+def create_jinja2_template(content, template_path, filename, theme=DEFAULT_THEME):
+    # content can be a list or a generator of fragments, they are written as they come.
+    # Returns True if the file was written.
     try:
-        template_content = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>{{filename}}</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-        }
-        p {
-            margin: 0 0 10px;
-        }
-        b {
-            display: block;
-            margin: 10px 0;
-            font-weight: bold;
-        }
-    </style>
-</head>
-<body>
-    {% for element in content %}
-    {% if element.strip() %}
-    {{ element|safe }}
-    {% endif %}
-    {% endfor %}
-</body>
-</html>
-"""
-        template = Template(template_content)
-        rendered_content = template.render(content=content, filename=filename)
-        
-        with open(template_path, 'w', encoding='utf-8') as f:
-            f.write(rendered_content)
-
-        print(f"Jinja2 template created successfully at {template_path}")
+        template = get_template(theme)
+        if stream_template(template, template_path, content, filename=filename):
+            print(f"Jinja2 template created successfully at {template_path}")
+            return True
     except Exception as e:
         print(f"An error occurred: {e}")
+    return False
 
-def remove_toc_anchors(content):
-    """Remove instances of {#_TocXXXXX .anchor} from the document."""
-    cleaned_content = []
-    toc_pattern = re.compile(r'\[\]\{#_Toc\d+ \.anchor\}')
-
-    for line in content:
-        cleaned_line = toc_pattern.sub('', line)
-        cleaned_content.append(cleaned_line)
-
-    return cleaned_content
-
-def convert_docx_to_markdown(input_file, output_file):
-    try:
-        # Read the docx file
-        doc = Document(input_file)
-        markdown_lines = []
-
-        for paragraph in doc.paragraphs:
-            line = paragraph.text.strip()
-            # Remove unwanted links and anchors
-            line = re.sub(r'\[.*?\]\{#.*?\}', '', line)
-            # Remove content inside curly braces {}
-            line = re.sub(r'\{.*?\}', '', line)
-            if line:
-                markdown_lines.append(line)
-        
-        # Remove TOC anchors from the markdown content
-        markdown_lines = remove_toc_anchors(markdown_lines)
-        
-        # Write the cleaned markdown lines to the output file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(markdown_lines))
-        
-        print(f"Converted {input_file} to Markdown successfully.")
-    except Exception as e:
-        print(f"Error converting {input_file} to Markdown: {e}")
-
-def clean_markdown(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        # Example of cleaning up the markdown content
-        # Remove excessive line breaks
-        content = re.sub(r'\n{2,}', '\n\n', content)
-        # Remove any other unwanted elements here
-
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(content)
-    except Exception as e:
-        print(f"Error cleaning Markdown file {file_path}: {e}")
-
-def convert_markdown_to_html(input_file, output_file):
-    try:
-        subprocess.run(['pandoc', input_file, '-o', output_file], check=True)
-        print(f"Converted {input_file} to HTML successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error converting {input_file} to HTML: {e}")
-
-def process_files(input_folder, output_folder):
+def process_files(input_folder, output_folder, use_cache=True, theme=DEFAULT_THEME):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    cache = ConversionCache() if use_cache else None
 
     for filename in os.listdir(input_folder):
         if filename.endswith('.pdf'):
             file_path = os.path.join(input_folder, filename)
-            content = read_pdf_file(file_path)
-            if content:
-                output_file_name = f"{os.path.splitext(filename)[0]}.html"
-                template_path = os.path.join(output_folder, output_file_name)
-                create_jinja2_template(content, template_path, filename)
+            output_file_name = f"{os.path.splitext(filename)[0]}.html"
+            template_path = os.path.join(output_folder, output_file_name)
+
+            # Unchanged input, converter and template: reuse the stored HTML
+            if cache:
+                key = cache.key(file_path, CONVERTER, CONVERTER_VERSION, template_key(theme))
+                if cache.fetch(key, template_path):
+                    continue
+
+            instrumentation.count('documents')
+            if create_jinja2_template(iter_pdf_file(file_path), template_path, filename, theme):
+                if cache:
+                    cache.put(key, template_path)
             else:
                 print(f"Failed to read the file: {filename}")
         
         elif filename.endswith('.docx'):
             input_file = os.path.join(input_folder, filename)
-            output_file_name = f"{os.path.splitext(filename)[0]}.md"
-            output_file = os.path.join(output_folder, output_file_name)
-            convert_docx_to_markdown(input_file, output_file)
-            clean_markdown(output_file)
             html_output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.html")
-            convert_markdown_to_html(output_file, html_output_file)
 
-input_folder = 'files'
-output_folder = 'output'
-process_files(input_folder, output_folder)
+            # The pandoc path is keyed on the filter instead of the jinja template
+            if cache:
+                key = cache.key(input_file, PIPELINE_CONVERTER, PIPELINE_VERSION, PIPELINE_FILTER)
+                if cache.fetch(key, html_output_file):
+                    continue
+
+            # One pandoc call, no intermediate markdown file
+            instrumentation.count('documents')
+            try:
+                convert_docx_to_html(input_file, html_output_file)
+                print(f"Converted {input_file} to HTML successfully.")
+                if cache:
+                    cache.put(key, html_output_file)
+            except subprocess.CalledProcessError as e:
+                print(f"Error converting {input_file} to HTML: {e}")
+
+    if cache:
+        print(cache.report())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert .pdf files with the jinja template and .docx files with pandoc')
+    parser.add_argument('input_folder', nargs='?', default='files')
+    parser.add_argument('output_folder', nargs='?', default='output')
+    parser.add_argument('--no-cache', action='store_true', help='reconvert every file, ignoring the cache')
+    parser.add_argument('--theme', choices=THEMES, default=DEFAULT_THEME, help='page template of the PDF output')
+    args = parser.parse_args()
+
+    process_files(args.input_folder, args.output_folder, use_cache=not args.no_cache, theme=args.theme)